@@ -0,0 +1,44 @@
+'''
+Startup time and resident memory of n Mock instruments, started as one InstrumentDaemon
+process each or as threads in a single InstrumentHost.
+
+    python -m benchmarks.host [n]
+'''
+import sys
+import time
+import psutil
+from squidpy.instrument import instrument, InstrumentHost, InstrumentList
+
+def _memory():
+    '''
+    Resident (rss) and unique (uss) memory of the child processes in MB.
+    rss counts pages shared between forked processes once per process, uss does not.
+    '''
+    procs = psutil.Process().children(recursive=True)
+    return (sum(p.memory_info().rss for p in procs)/2**20,
+            sum(p.memory_full_info().uss for p in procs)/2**20)
+
+def run(n=10):
+    results = {}
+    for mode in ['daemons', 'host']:
+        rss, uss = _memory()
+        t0 = time.perf_counter()
+        if mode == 'daemons':
+            instruments = [instrument('Mock', wait=0, name='mock%d' %i) for i in range(n)]
+        else:
+            host = InstrumentHost()
+            instruments = [host.instrument('Mock', wait=0, name='mock%d' %i) for i in range(n)]
+        for i, ins in enumerate(instruments):
+            ins._name = 'mock%d' %i
+        startup = time.perf_counter() - t0
+        rss_after, uss_after = _memory()
+        results[mode] = {'startup': startup, 'rss': rss_after - rss, 'uss': uss_after - uss}
+        InstrumentList(*instruments).close()
+        if mode == 'host':
+            host.terminate()
+    return results
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10
+    for mode, result in run(n).items():
+        print('%-8s startup %6.3f s   rss %7.1f MB   uss %7.1f MB' %(mode, result['startup'], result['rss'], result['uss']))
@@ -0,0 +1,71 @@
+'''
+Import time of squidpy, in a fresh interpreter (main process) and in a spawned child process
+(like Measurement, or InstrumentDaemon on Windows). Also lists which heavy libraries got loaded.
+
+    python -m benchmarks.imports [repeats]
+'''
+import sys
+import time
+import subprocess
+import importlib
+from multiprocessing import get_context
+
+ctx = get_context('spawn')
+
+IMPORTS = [
+    ('squidpy', 'import squidpy'),
+    ('squidpy.instrument', 'import squidpy.instrument'),
+    ('driver', 'import squidpy.instrument; squidpy.instruments.get_driver("Mock")'),
+    ('squidpy.experiment', 'import squidpy.experiment'),
+    ('Experiment', 'import squidpy; squidpy.Experiment'),
+]
+
+HEAVY = ['numpy', 'pandas', 'matplotlib', 'seaborn', 'IPython', 'visa', 'instrumental', 'psutil']
+
+def _median(values):
+    values = sorted(values)
+    return values[len(values)//2]
+
+def _interpreter_time(statement, repeats):
+    '''Median wall time of a fresh interpreter running statement, and the heavy modules it loaded.'''
+    code = '%s; import sys; print(",".join(m for m in %r if m in sys.modules))' %(statement, HEAVY)
+    times = []
+    for i in range(repeats):
+        t0 = time.perf_counter()
+        output = subprocess.check_output([sys.executable, '-c', code])
+        times.append(time.perf_counter() - t0)
+    return _median(times), output.decode().strip()
+
+def _child(module, pipe):
+    importlib.import_module(module)
+    pipe.send(time.perf_counter())
+
+def _spawn_time(module, repeats):
+    '''Median time from starting a spawned child until it has imported module.'''
+    times = []
+    for i in range(repeats):
+        pipe = ctx.Pipe()
+        t0 = time.perf_counter()
+        proc = ctx.Process(target=_child, args=(module, pipe[1]))
+        proc.start()
+        times.append(pipe[0].recv() - t0)
+        proc.join()
+    return _median(times)
+
+def run(repeats=5):
+    baseline, _ = _interpreter_time('pass', repeats)
+    results = {'python': {'main': baseline}}
+    for label, statement in IMPORTS:
+        main, loaded = _interpreter_time(statement, repeats)
+        results[label] = {'main': main - baseline, 'loaded': loaded}
+    for module in ['squidpy.instrument', 'squidpy.experiment']:
+        results[module]['spawn'] = _spawn_time(module, repeats)
+    return results
+
+if __name__ == '__main__':
+    repeats = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    results = run(repeats)
+    print('python startup %6.3f s' %results.pop('python')['main'])
+    for label, result in results.items():
+        spawn = '   spawned child %6.3f s' %result['spawn'] if 'spawn' in result else ''
+        print('%-20s import %6.3f s%s   loaded: %s' %(label, result['main'], spawn, result['loaded'] or '-'))
@@ -0,0 +1,44 @@
+'''
+Per-command latency of InstrumentDaemon against a Mock(wait=0) instrument.
+
+Compares a local property read with the same read through RemoteInstrument and
+through InstrumentList.get_datapoint_async, so the remaining overhead is the
+pipe round trip itself. 'stats record' is the cost of recording the timing of one command.
+
+    python -m benchmarks.latency [n]
+'''
+import sys
+import time
+import numpy as np
+from squidpy.instrument import instrument, InstrumentList
+from squidpy.instruments import Mock
+from squidpy.profiling import CommandStats
+
+def _time(func, n):
+    times = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        func()
+        times[i] = time.perf_counter() - t0
+    return times
+
+def run(n=2000):
+    local = Mock(wait=0)
+    mock = instrument('Mock', wait=0)
+    mock._name = 'mock'
+    instruments = InstrumentList(mock)
+    params = {'mock': ['voltage', 'output_voltage']}
+    results = {}
+    results['local get'] = _time(lambda: local.voltage, n)
+    results['remote get'] = _time(lambda: mock.voltage, n)
+    results['remote set'] = _time(lambda: setattr(mock, 'output_voltage', 1.), n)
+    results['get_datapoint_async'] = _time(lambda: instruments.get_datapoint_async(params), n)
+    stats = CommandStats()
+    results['stats record'] = _time(lambda: stats.record('get voltage', 5e-5, 1e-4, 2e-5), n)
+    instruments.close()
+    return results
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    for key, times in run(n).items():
+        print('%-22s median %7.1f us   p99 %7.1f us' %(key, np.median(times)*1e6, np.percentile(times, 99)*1e6))
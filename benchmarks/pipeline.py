@@ -0,0 +1,256 @@
+'''
+Throughput of the acquisition pipeline with Mock(wait=0) instruments, stage by stage and end to end.
+
+Stages, each measured on its own:
+    instrument   InstrumentList.set_and_get_datapoint, the instrument pipe round trips of one point
+    measurement  Measurement.do_measurement of a 1D sweep, until all datapoints are on its data pipe
+    collector    DataCollector.run, batched datapoints from a pipe into the Manager dict and the data file
+    add_dp       Data.add_dp, appending one datapoint to the data file
+End to end, Experiment.run of a 1D and a 2D sweep, with the points/s sustained by the data file
+and the memory of the whole process tree sampled along the way.
+
+    python -m benchmarks.pipeline [--points N] [--stage-points N] [--timeout S] [--output FILE]
+    python -m benchmarks.pipeline --compare old.json new.json
+
+Results are written as JSON with the git revision, so runs of different revisions can be compared.
+A run that hits the timeout reports the points it reached.
+'''
+import os
+import sys
+import json
+import time
+import math
+import argparse
+import platform
+import tempfile
+import threading
+import subprocess
+from multiprocessing import Pipe, Manager
+import numpy as np
+import psutil
+from squidpy.instrument import instrument, InstrumentList
+
+PARAMS = {'a': ['voltage', 'output_voltage'], 'b': ['voltage', 'output_voltage']}
+
+def _revision():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    try:
+        rev = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=root).decode().strip()
+        dirty = subprocess.call(['git', 'diff', '--quiet', 'HEAD'], cwd=root) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return 'unknown'
+    return rev + ('-dirty' if dirty else '')
+
+def _summary(times):
+    '''Latency statistics of per-point times (s).'''
+    times = np.asarray(times)
+    return {'points': len(times),
+            'median_us': float(np.median(times)*1e6),
+            'p99_us': float(np.percentile(times, 99)*1e6),
+            'mean_us': float(times.mean()*1e6),
+            'points_per_s': float(len(times)/times.sum())}
+
+def _tree_rss():
+    '''Resident memory of this process and all its children in MB.'''
+    procs = [psutil.Process()] + psutil.Process().children(recursive=True)
+    rss = 0
+    for proc in procs:
+        try:
+            rss += proc.memory_info().rss
+        except psutil.Error:
+            pass
+    return rss/2**20
+
+def _instruments():
+    a = instrument('Mock', wait=0, name='a')
+    b = instrument('Mock', wait=0, name='b')
+    a._name, b._name = 'a', 'b'
+    return InstrumentList(a, b)
+
+def _datapoint(i):
+    return {'a.voltage': 10, 'a.output_voltage': float(i), 'b.voltage': 10, 'b.output_voltage': 0.}
+
+def stage_instrument(instruments, n):
+    times = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        instruments.set_and_get_datapoint('a', 'output_voltage', float(i), PARAMS)
+        times[i] = time.perf_counter() - t0
+    return _summary(times)
+
+def stage_measurement(instruments, n):
+    from squidpy.experiment import Measurement
+    measlist = [{'type': 'sweep', 'params': ('a', 'output_voltage', 0, n-1, 1)},
+                {'type': 'measure', 'params': PARAMS}]
+    measurement = Measurement(instruments, measlist)
+    measurement.instruments = instruments
+    received = [0]
+    def drain():
+        while True:
+            message = measurement.pipe[1].recv()
+            if message is None:
+                break
+            if message[0] == 'batch':
+                received[0] += len(message[1][0])
+    thread = threading.Thread(target=drain)
+    thread.start()
+    t0 = time.perf_counter()
+    measurement.do_measurement(list(measlist))
+    measurement.pipe[0].send(None)
+    thread.join()
+    elapsed = time.perf_counter() - t0
+    return {'points': received[0], 'elapsed_s': elapsed, 'points_per_s': received[0]/elapsed,
+            'mean_us': elapsed/max(received[0], 1)*1e6, 'timed_out': received[0] < n}
+
+def stage_collector(n, folder, timeout):
+    from squidpy.data import DataCollector
+    from squidpy.transport import BatchSender
+    manager = Manager()
+    pipe = Pipe()
+    collector = DataCollector(pipe[1], manager.dict(), 'collector', folder)
+    stop = threading.Event()
+    def feed():
+        sender = BatchSender(pipe[0])
+        for i in range(n):
+            if stop.is_set():
+                break
+            sender.send(_datapoint(i))
+        sender.close()
+        pipe[0].send(None)
+    thread = threading.Thread(target=feed)
+    thread.daemon = True
+    thread.start()
+    timer = threading.Timer(timeout, stop.set)
+    timer.start()
+    t0 = time.perf_counter()
+    collector.run()
+    elapsed = time.perf_counter() - t0
+    timer.cancel()
+    points = len(collector.output['data'])
+    manager.shutdown()
+    return {'points': points, 'elapsed_s': elapsed, 'points_per_s': points/elapsed,
+            'mean_us': elapsed/max(points, 1)*1e6, 'timed_out': points < n}
+
+def stage_add_dp(n, folder):
+    from squidpy.data import Data
+    data = Data(title='add_dp', folder=folder)
+    times = np.empty(n)
+    for i in range(n):
+        dp = _datapoint(i)
+        t0 = time.perf_counter()
+        data.add_dp(dp)
+        times[i] = time.perf_counter() - t0
+    return _summary(times)
+
+def _count_lines(filename, state):
+    '''Count the lines added to filename since the last call (state keeps the offset).'''
+    if not os.path.exists(filename):
+        return state['lines']
+    with open(filename, 'rb') as f:
+        f.seek(state['offset'])
+        chunk = f.read()
+    state['offset'] += len(chunk)
+    state['lines'] += chunk.count(b'\n')
+    return state['lines']
+
+def end_to_end(sweeps, n, timeout, interval=1.):
+    '''Run Experiment with the given sweeps (ins, param, points) and follow its data file.'''
+    from squidpy.experiment import Experiment
+    experiment = Experiment('pipeline')
+    for ins, param, points in sweeps:
+        experiment.sweep('%s.%s' %(ins, param))[0:points-1:1]
+    experiment.measure(PARAMS)
+    rss0 = _tree_rss()
+    t0 = time.perf_counter()
+    experiment.run()
+    filename = None
+    state = {'offset': 0, 'lines': 0}
+    samples = []
+    points = 0
+    while True:
+        time.sleep(interval)
+        if filename is None and 'stamp' in experiment.output.keys():
+            filename = os.path.join('data', '%s_%s.dat' %(experiment.output['stamp'], experiment.title))
+        alive = experiment.datacollector.is_alive()
+        points = max(_count_lines(filename, state) - 1, 0) if filename else 0
+        elapsed = time.perf_counter() - t0
+        if not alive or points >= n or elapsed > timeout:
+            break
+        # Only sampled while the pipeline runs, exited processes would drop out of the tree
+        samples.append({'t_s': elapsed, 'points': points, 'rss_mb': _tree_rss()})
+    elapsed = time.perf_counter() - t0
+    # Growth is taken from the first sample with data, after the processes have started
+    running = [sample for sample in samples if sample['points'] > 0] or samples or [{'points': 0, 'rss_mb': rss0}]
+    rss1 = running[-1]['rss_mb']
+    growth = (rss1 - running[0]['rss_mb'])/max(running[-1]['points'] - running[0]['points'], 1)*1e5
+    experiment.measurement.terminate()
+    experiment.datacollector.terminate()
+    experiment.manager.shutdown()
+    return {'points': points, 'target_points': n, 'elapsed_s': elapsed,
+            'points_per_s': points/elapsed, 'timed_out': points < n,
+            'rss_start_mb': rss0, 'rss_end_mb': rss1,
+            'rss_growth_mb_per_1e5_points': growth,
+            'samples': samples}
+
+def run(points=10**5, stage_points=10**4, timeout=300.):
+    results = {'revision': _revision(),
+               'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+               'python': platform.python_version(),
+               'platform': platform.platform(),
+               'points': points, 'stage_points': stage_points, 'timeout_s': timeout,
+               'stages': {}}
+    folder = tempfile.mkdtemp(prefix='squidpy_pipeline_')
+    cwd = os.getcwd()
+    os.chdir(folder)
+    try:
+        instruments = _instruments()
+        results['stages']['instrument'] = stage_instrument(instruments, stage_points)
+        results['stages']['measurement'] = stage_measurement(instruments, stage_points)
+        results['stages']['collector'] = stage_collector(stage_points, 'data', timeout)
+        results['stages']['add_dp'] = stage_add_dp(stage_points, 'data')
+        side = int(math.ceil(math.sqrt(points)))
+        results['1d'] = end_to_end([('a', 'output_voltage', points)], points, timeout)
+        results['2d'] = end_to_end([('b', 'output_voltage', side), ('a', 'output_voltage', side)], side*side, timeout)
+        instruments.close()
+    finally:
+        os.chdir(cwd)
+    return results
+
+def _print(results):
+    print('revision %s' %results['revision'])
+    for stage, result in results['stages'].items():
+        print('%-12s %10.0f points/s   mean %8.1f us   %s' %(stage, result['points_per_s'], result['mean_us'],
+              'median %.1f us  p99 %.1f us' %(result['median_us'], result['p99_us']) if 'median_us' in result else
+              '(%d points%s)' %(result['points'], ', timed out' if result['timed_out'] else '')))
+    for key in ['1d', '2d']:
+        result = results[key]
+        print('%-12s %10.0f points/s   %d/%d points in %.1f s   rss %+.1f MB per 1e5 points' %(key,
+              result['points_per_s'], result['points'], result['target_points'], result['elapsed_s'],
+              result['rss_growth_mb_per_1e5_points']))
+
+def compare(old, new):
+    '''Print the points/s of every stage of two result files and their ratio.'''
+    old, new = [json.load(open(filename)) for filename in [old, new]]
+    print('%-12s %14s %14s %7s' %('', old['revision'][:12], new['revision'][:12], 'ratio'))
+    rows = [(stage, old['stages'][stage], new['stages'][stage]) for stage in new['stages'] if stage in old['stages']]
+    rows += [(key, old[key], new[key]) for key in ['1d', '2d'] if key in old and key in new]
+    for name, a, b in rows:
+        print('%-12s %14.0f %14.0f %7.2f' %(name, a['points_per_s'], b['points_per_s'], b['points_per_s']/a['points_per_s']))
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Acquisition pipeline benchmark')
+    parser.add_argument('--points', type=int, default=10**5, help='points of the end to end sweeps')
+    parser.add_argument('--stage-points', type=int, default=10**4, help='points per stage benchmark')
+    parser.add_argument('--timeout', type=float, default=300., help='time limit per run (s)')
+    parser.add_argument('--output', default=None, help='JSON result file (default pipeline_<revision>.json)')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    args = parser.parse_args()
+    if args.compare:
+        compare(*args.compare)
+        sys.exit()
+    results = run(args.points, args.stage_points, args.timeout)
+    _print(results)
+    output = args.output or 'pipeline_%s.json' %results['revision'][:12]
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=1)
+    print('results written to %s' %output)
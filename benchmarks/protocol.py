@@ -0,0 +1,70 @@
+'''
+Round-trip latency of the instrument pipe protocol against the old eval'd string commands.
+
+Both servers answer from a blocking loop around the same Mock instrument, the protocol one
+from serve_instrument as in the instrument daemons, so the difference is the cost of
+formatting, parsing and eval'ing commands and replies.
+
+    python -m benchmarks.protocol [n]
+'''
+import sys
+import time
+import re
+import numpy as np
+from multiprocessing import Process, Pipe
+from squidpy.utils import ask_pipe, ask_request, GET, SET, CALL, CLOSE
+from squidpy.instrument import serve_instrument
+from squidpy.instruments import Mock
+
+def _legacy_server(pipe):
+    instrument = Mock(wait=0)
+    while True:
+        cmd = pipe.recv()
+        if not cmd: break
+        try:
+            if '=' in cmd:
+                param, value = re.split('=', cmd.replace(' ', ''))
+                setattr(instrument, param, eval(value))
+                response = 'True'
+            elif '(' in cmd:
+                response = eval('instrument.' + cmd)
+            else:
+                response = str(getattr(instrument, cmd))
+            pipe.send(response)
+        except Exception:
+            pipe.send('None')
+
+def _protocol_server(pipe):
+    # The loop of the instrument daemons, so the benchmark follows the protocol
+    serve_instrument(Mock(wait=0), pipe)
+
+def _time(func, n):
+    times = np.empty(n)
+    for i in range(n):
+        t0 = time.perf_counter()
+        func()
+        times[i] = time.perf_counter() - t0
+    return times
+
+def run(n=10000):
+    results = {}
+    legacy_pipe, legacy_child = Pipe()
+    protocol_pipe, protocol_child = Pipe()
+    servers = [Process(target=_legacy_server, args=(legacy_child,)),
+               Process(target=_protocol_server, args=(protocol_child,))]
+    [server.start() for server in servers]
+    results['legacy get'] = _time(lambda: ask_pipe(legacy_pipe, 'voltage'), n)
+    results['protocol get'] = _time(lambda: ask_request(protocol_pipe, GET, 'voltage'), n)
+    results['legacy set'] = _time(lambda: ask_pipe(legacy_pipe, 'output_voltage = 1.5'), n)
+    results['protocol set'] = _time(lambda: ask_request(protocol_pipe, SET, 'output_voltage', 1.5), n)
+    results['legacy get_datapoint'] = _time(lambda: ask_pipe(legacy_pipe, "get_datapoint(['voltage', 'output_voltage'])"), n)
+    results['protocol get_datapoint'] = _time(lambda: ask_request(protocol_pipe, CALL, 'get_datapoint', ['voltage', 'output_voltage']), n)
+    legacy_pipe.send('')
+    ask_request(protocol_pipe, CLOSE)
+    [server.join() for server in servers]
+    return results
+
+if __name__ == '__main__':
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    for key, times in run(n).items():
+        print('%-24s median %7.1f us   p99 %7.1f us' %(key, np.median(times)*1e6, np.percentile(times, 99)*1e6))
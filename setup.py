@@ -1,4 +1,4 @@
-from distutils.core import setup
+from setuptools import setup
 
 setup(
     name='squidpy',
@@ -13,6 +13,8 @@ setup(
     license='LICENSE.txt',
     description='Measurement suite for scanning SQUID lab. Made for smooth integration with ipython notebook.',
     long_description=open('readme.md').read(),
+    # Lazy package attributes need 3.7, streaming through shared memory 3.8
+    python_requires='>=3.8',
     install_requires=[
         "Numpy >= 1.6.1",
         "pandas >= 0.14",
@@ -1 +1,52 @@
-from .squidpy import *
\ No newline at end of file
+'''
+Measurement suite for scanning SQUID lab.
+Only the instrument layer is imported with the package. Drivers, Experiment, Data and the rest of
+squidpy.squidpy (pandas, plotting) are imported on first access, e.g. squidpy.Experiment,
+or by from squidpy import *. Needs Python 3.7 for the module __getattr__.
+'''
+import importlib
+import sys
+from .instrument import *
+from . import instruments
+
+# Names that are imported on first access, by module
+_lazy_modules = {
+    'data': ['Data', 'DataCollector', 'to_json', 'load_checkpoint', 'read_data'],
+    'experiment': ['Experiment', 'Measurement', 'Sweep'],
+    'scheduler': ['ExperimentScheduler'],
+    'server': ['Server', 'RemoteExperiment', 'RemoteDataCollector', 'run_server', 'get_socket', 'get_instruments'],
+    'sim': ['Sample', 'Ramp', 'SimResource', 'SimKeithley2400', 'SimKeithley6220', 'SimKeithley2182A', 'SimSR830',
+            'SimServer', 'SimPPMS', 'SimMontana', 'get_sample', 'is_simulated', 'open_resource'],
+    'ringbuffer': ['RingBuffer'],
+    'cache': ['ParameterCache', 'SetpointTracker', 'UNTIL_SET'],
+    'utils': ['create_stamp', 'set_logging_config', 'setup_matplotlib', 'get_array'],
+}
+_lazy = {name: module for module in _lazy_modules for name in _lazy_modules[module]}
+
+def _available_drivers():
+    '''Drivers whose dependencies are installed.'''
+    available = []
+    for name in instruments._drivers:
+        try:
+            instruments.get_driver(name)
+            available.append(name)
+        except ImportError:
+            pass
+    return available
+
+def __getattr__(name):
+    if name == '__all__':
+        # from squidpy import * exports the names of squidpy.squidpy and the drivers, as before the lazy imports
+        module = importlib.import_module('squidpy.squidpy')
+        return sorted(set([key for key in vars(module) if not key.startswith('_')] + _available_drivers()))
+    if name in instruments._drivers:
+        return instruments.get_driver(name)
+    if name in _lazy:
+        return getattr(importlib.import_module('squidpy.%s' %_lazy[name]), name)
+    # The rest of __all__, once it has been imported
+    if name in vars(sys.modules.get('squidpy.squidpy', object)):
+        return getattr(sys.modules['squidpy.squidpy'], name)
+    raise AttributeError('module \'squidpy\' has no attribute \'%s\'' %name)
+
+def __dir__():
+    return sorted(set(globals()) | set(_lazy) | set(instruments._drivers))
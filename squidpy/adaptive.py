@@ -0,0 +1,93 @@
+'''
+Adaptive sampling: measure a coarse grid first and add points where the measured value changes fastest.
+'''
+import math
+import itertools
+
+class AdaptiveGrid(object):
+    '''
+    Rectilinear grid with one or two axes (the outer axis first), refined one grid line at a time.
+    Every interval between neighbouring coordinates of an axis has a loss, the largest along the
+    grid lines that cross it, with coordinates and values scaled to their ranges:
+        gradient   length of the segment between the two points
+        curvature  square root of the area of the triangles the segment forms with its neighbours,
+                   plus a tenth of its width so flat regions are refined last
+    The interval with the largest loss is split in the middle, which adds one point in 1D and a
+    row or column of points in 2D. Refinement stops when the next split would take more than
+    budget points, when no loss is above tol, or when all intervals are narrower than 2*min_step.
+    '''
+    def __init__(self, axes, min_steps, budget=None, tol=None, criterion='gradient'):
+        if criterion not in ['gradient', 'curvature']:
+            raise ValueError('Unknown criterion %s' %criterion)
+        self.axes = [sorted(set(float(value) for value in axis)) for axis in axes]
+        self.min_steps = min_steps
+        self.budget = budget
+        self.tol = tol
+        self.criterion = criterion
+        self.values = {}
+        self._started = False
+
+    def ask(self):
+        '''Points to measure next, as tuples of coordinates. An empty list when the grid is done.'''
+        if not self._started:
+            self._started = True
+            return list(itertools.product(*self.axes))
+        split = self.best_split()
+        if split is None:
+            return []
+        axis, coordinate = split
+        self.axes[axis] = sorted(self.axes[axis] + [coordinate])
+        lines = [[coordinate] if k == axis else coordinates for k, coordinates in enumerate(self.axes)]
+        return list(itertools.product(*lines))
+
+    def tell(self, point, value):
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            value = float('nan')
+        self.values[tuple(point)] = value
+
+    def best_split(self):
+        '''(axis, coordinate) of the next grid line, or None if refinement is done.'''
+        finite = [value for value in self.values.values() if not math.isnan(value)]
+        value_range = (max(finite) - min(finite)) if len(finite) > 0 else 0
+        best, best_loss = None, 0
+        for axis in range(len(self.axes)):
+            new_points = 1
+            for k, coordinates in enumerate(self.axes):
+                if k != axis:
+                    new_points *= len(coordinates)
+            if self.budget is not None and len(self.values) + new_points > self.budget:
+                continue
+            for j, loss in enumerate(self.losses(axis, value_range or 1.)):
+                if loss > best_loss:
+                    best, best_loss = (axis, (self.axes[axis][j] + self.axes[axis][j+1])/2.), loss
+        if best is None or (self.tol is not None and best_loss <= self.tol):
+            return None
+        return best
+
+    def losses(self, axis, value_range):
+        '''Loss of every interval of axis, 0 for intervals that are too narrow to split.'''
+        coordinates = self.axes[axis]
+        scale = (coordinates[-1] - coordinates[0]) or 1.
+        others = [[None] if k == axis else other for k, other in enumerate(self.axes)]
+        losses = [0]*(len(coordinates) - 1)
+        for line in itertools.product(*others):
+            x = [c/scale for c in coordinates]
+            z = [self.values.get(line[:axis] + (c,) + line[axis+1:], float('nan'))/value_range for c in coordinates]
+            for j in range(len(coordinates) - 1):
+                if coordinates[j+1] - coordinates[j] < 2*self.min_steps[axis]:
+                    continue
+                loss = self._loss(x, z, j)
+                if loss == loss and loss > losses[j]:
+                    losses[j] = loss
+        return losses
+
+    def _loss(self, x, z, j):
+        width = x[j+1] - x[j]
+        if self.criterion == 'gradient':
+            return math.hypot(width, z[j+1] - z[j])
+        areas = [abs((x[i+1] - x[i])*(z[i+2] - z[i]) - (x[i+2] - x[i])*(z[i+1] - z[i]))/2.
+                 for i in [j-1, j] if i >= 0 and i+2 < len(x)]
+        areas = [area for area in areas if area == area]
+        return math.sqrt(max(areas)) + width/10. if len(areas) > 0 else width
@@ -0,0 +1,103 @@
+import time
+
+UNTIL_SET = 'set'
+
+class ParameterCache(object):
+    '''
+    Cache for instrument parameter values.
+    The policy per parameter is None (never cache), a number of seconds the value stays valid,
+    or UNTIL_SET to keep the value until the parameter is set again.
+    Setting a parameter writes the new value through to the cache.
+    '''
+    def __init__(self, policy=None):
+        self.policy = dict(policy) if policy is not None else {}
+        self._values = {}
+        self.hits = 0
+        self.misses = 0
+        # Invalidated parameters are collected here when it is a list, see pop_invalidations
+        self.invalidations = None
+
+    def get(self, param, fget):
+        '''Return the cached value of param, or call fget and cache its result.'''
+        policy = self.policy.get(param)
+        if policy is None:
+            return fget()
+        if param in self._values:
+            value, timestamp = self._values[param]
+            if policy == UNTIL_SET or time.monotonic() - timestamp < policy:
+                self.hits += 1
+                return value
+        self.misses += 1
+        value = fget()
+        self._values[param] = (value, time.monotonic())
+        return value
+
+    def set(self, param, value):
+        if self.policy.get(param) is not None:
+            self._values[param] = (value, time.monotonic())
+
+    def invalidate(self, param=None):
+        '''Drop the cached value of param, or of all parameters if param is None.'''
+        if param is None:
+            self._values.clear()
+        else:
+            self._values.pop(param, None)
+        if self.invalidations is not None:
+            self.invalidations.append(param)
+
+    def pop_invalidations(self):
+        '''Parameters invalidated since the last call, None stands for all of them.'''
+        invalidations, self.invalidations = self.invalidations, []
+        return invalidations
+
+    def stats(self):
+        return {'hits': self.hits, 'misses': self.misses}
+
+class SetpointTracker(object):
+    '''
+    Last value written to every (instrument, parameter), to skip writes that would not change it.
+    Two values are equal within the driver's _tolerance for the parameter (default: exactly equal),
+    parameters in the driver's _rewrite list are written every time.
+    '''
+    def __init__(self, instruments):
+        self.instruments = instruments
+        self._values = {}
+        self.written = {}
+        self.skipped = {}
+
+    def changed(self, ins, param, value):
+        '''True if writing value to ins.param would change the last written value.'''
+        instrument = self.instruments.todict[ins]
+        if param in instrument._rewrite or (ins, param) not in self._values:
+            return True
+        last = self._values[(ins, param)]
+        try:
+            return abs(value - last) > instrument._tolerance.get(param, 0)
+        except TypeError:
+            return value != last
+
+    def filter(self, sets):
+        '''Return the setpoints [(ins, param, value)] that have to be written, and remember them as written.'''
+        todo = []
+        for ins, param, value in sets:
+            key = '%s.%s' %(ins, param)
+            if self.changed(ins, param, value):
+                self._values[(ins, param)] = value
+                self.written[key] = self.written.get(key, 0) + 1
+                todo.append((ins, param, value))
+            else:
+                self.skipped[key] = self.skipped.get(key, 0) + 1
+        return todo
+
+    def forget(self, ins=None, param=None):
+        '''Forget the last written value of ins.param, of all parameters of ins, or of everything.'''
+        if ins is None:
+            self._values.clear()
+        elif param is None:
+            for key in [key for key in self._values if key[0] == ins]:
+                del self._values[key]
+        else:
+            self._values.pop((ins, param), None)
+
+    def stats(self):
+        return {'written': self.written, 'skipped': self.skipped}
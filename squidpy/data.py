@@ -4,6 +4,7 @@ from multiprocessing import Process, Queue, Pipe
 import time
 import os
 import select
+import logging
 
 class Data(pd.DataFrame):
     '''
@@ -19,30 +20,109 @@ class Data(pd.DataFrame):
             os.mkdir(self.folder)
         self.filename = os.path.join(self.folder,filename)
         self.len = 0
+        # Columns in the header of the data file
+        self.header = []
     
     def add_dp(self, dp):
-        proc_seqf = open(self.filename,'a')
+        columns = sorted(dp.keys())
+        self.add_batch(columns, [[dp[key]] for key in columns])
+
+    def add_batch(self, columns, values):
+        '''
+        Append a batch of datapoints, given as sorted column names and one sequence of values per column.
+        Columns that are not in the header of the file yet are added to it, with empty values in the
+        rows so far. Columns of the header that the batch does not have are left empty.
+        '''
         if self.len == 0:
-            proc_seqf.write(("{}\t"*len(dp) + "\n").format(*sorted(dp.keys())))
-        sorted_values = [dp[key] for key in sorted(dp.keys())]
-        proc_seqf.write(("{}\t"*len(dp) + "\n").format(*sorted_values))
-        proc_seqf.close()
-        self.len += 1
+            self.header = list(columns)
+            with open(self.filename, 'a') as f:
+                f.write(("{}\t"*len(columns) + "\n").format(*columns))
+        elif columns != self.header:
+            self._widen([column for column in columns if column not in self.header])
+        if columns != self.header:
+            index = {column: i for i, column in enumerate(columns)}
+            values = [values[index[column]] if column in index else ['']*len(values[0]) for column in self.header]
+        with open(self.filename, 'a') as f:
+            row = "{}\t"*len(self.header) + "\n"
+            for dp in zip(*values):
+                f.write(row.format(*dp))
+        self.len += len(values[0]) if len(values) > 0 else 0
+
+    def _widen(self, columns):
+        '''Add columns to the header of the data file, and empty values for them to its rows.'''
+        if len(columns) == 0:
+            return
+        with open(self.filename) as f:
+            lines = f.readlines()
+        self.header = self.header + columns
+        lines[0] = ("{}\t"*len(self.header) + "\n").format(*self.header)
+        lines[1:] = [line.rstrip('\n') + "\t"*len(columns) + "\n" for line in lines[1:]]
+        with open(self.filename, 'w') as f:
+            f.writelines(lines)
         
     def save(self, filename=''):
         if filename != '':
             self.filename = filename
         self.to_csv(self.filename, columns=sorted(self.keys()), sep='\t')
+
+    def save_metadata(self, metadata):
+        '''Save metadata of the run (measurement list, instrument statistics) as JSON next to the data file.'''
+        import json
+        with open(os.path.splitext(self.filename)[0] + '.json', 'w') as f:
+            json.dump(metadata, f, indent=1, default=str)
+
+    def save_checkpoint(self, checkpoint):
+        '''Save the position of the run in its plan next to the data file, see Experiment.resume.'''
+        import json
+        filename = os.path.splitext(self.filename)[0] + '.checkpoint'
+        # Replace the file in one go, so a crash never leaves half a checkpoint
+        with open(filename + '.tmp', 'w') as f:
+            json.dump(checkpoint, f, default=to_json)
+        os.replace(filename + '.tmp', filename)
+
+    def truncate(self, points):
+        '''Keep the header and the first points rows of the data file, to append to it from there.'''
+        with open(self.filename) as f:
+            lines = f.readlines()[:points + 1] if points > 0 else []
+        with open(self.filename, 'w') as f:
+            f.writelines(lines)
+        self.len = points
+        self.header = [column for column in lines[0].rstrip('\n').split('\t') if column != ''] if len(lines) > 0 else []
+
+def to_json(obj):
+    '''JSON representation of numpy arrays and values in measurement lists, other objects become strings.'''
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+def load_checkpoint(folder, stamp, title):
+    '''Checkpoint of the run with stamp and title, see Data.save_checkpoint.'''
+    import json
+    with open(os.path.join(folder, '%s_%s.checkpoint' %(stamp, title))) as f:
+        return json.load(f)
+
+def read_data(folder, stamp, title, points=None):
+    '''Read the data file of the run with stamp and title, only its first points rows if given.'''
+    data = pd.read_csv(os.path.join(folder, '%s_%s.dat' %(stamp, title)), sep='\t', nrows=points)
+    # Every row ends with a tab, which adds an unnamed column
+    return data[[column for column in data.columns if not column.startswith('Unnamed')]]
         
 class DataCollector(Process):
     '''
     DataCollector class for continuously storing incoming datapoints from pipe.
     Also handles periodic data saving and plotting.
     Returns the Data instance through a dict variable (output) created by a Manager.
+    Checkpoints of the run are saved next to the data, given resume_points the collector
+    appends to the data file of a resumed run after that many points.
+    New datapoints are published to output every publish_interval seconds and at the end,
+    as the whole DataFrame goes through the Manager every time.
     '''
-    def __init__(self, pipe=None, output=None, title='Untitled', folder='data', stamp=None, save_data=True):
+    def __init__(self, pipe=None, output=None, title='Untitled', folder='data', stamp=None, save_data=True, resume_points=None,
+                 publish_interval=.5):
         super(DataCollector, self).__init__()
         self.pipe = pipe
+        self.resume_points = resume_points
+        self.publish_interval = publish_interval
         if stamp is None:
             stamp = create_stamp()
         self.title = title
@@ -56,20 +136,56 @@ class DataCollector(Process):
             self.output['stamp'] = stamp
             self.output['data'] = pd.DataFrame()
 
+    def _save(self, add, *args):
+        '''Add datapoints to the data file with add. Returns True if that failed.'''
+        try:
+            add(*args)
+            return False
+        except Exception as e:
+            logging.error('Datapoints could not be saved, checkpoints are not saved anymore: %s' %e)
+            return True
+
     def run(self):
+        from squidpy.transport import unpack
         running = True
         data = Data(**self.output)
+        if self.resume_points is not None and self.save_data:
+            # Append to the data file of a resumed run, after its last checkpointed point
+            data.truncate(self.resume_points)
+        columns = []
+        write_failed = False
+        frame = self.output['data']
+        new = []
+        published = time.monotonic()
         while running:
+            # Wait for data instead of polling at fixed intervals
+            self.pipe.poll(0.1)
             while self.pipe.poll():
                 dp = self.pipe.recv()
-                if dp is not None:
-                    self.output['data'] = self.output['data'].append(dp, ignore_index = True)
+                if isinstance(dp, tuple):
+                    # (kind, value) messages, see squidpy.transport, and ('metadata', dict) at the end of a measurement
+                    kind, value = dp
+                    if kind == 'schema':
+                        columns = value
+                    elif kind == 'batch':
+                        batch = pd.DataFrame({column: unpack(values) for column, values in zip(columns, value)})
+                        new.append(batch)
+                        if self.save_data:
+                            write_failed = self._save(data.add_batch, columns, value) or write_failed
+                    elif kind == 'checkpoint' and self.save_data and not write_failed:
+                        # A checkpoint must not count points that are not in the file
+                        data.save_checkpoint(value)
+                    elif kind == 'metadata' and self.save_data:
+                        data.save_metadata(value)
+                elif dp is not None:
+                    new.append(pd.DataFrame([dp]))
                     if self.save_data:
-                        try:
-                            data.add_dp(dp)
-                        except:
-                            pass
+                        write_failed = self._save(data.add_dp, dp) or write_failed
                 else:
                     running = False
                     break
-            time.sleep(0.01)
\ No newline at end of file
+            if len(new) > 0 and (not running or time.monotonic() - published >= self.publish_interval):
+                frame = pd.concat([frame] + new, ignore_index = True)
+                self.output['data'] = frame
+                new = []
+                published = time.monotonic()
\ No newline at end of file
@@ -1,17 +1,13 @@
 from multiprocessing import Process, Pipe, Manager, get_context, Queue
-from squidpy.utils import get_array, ask_socket, read_pipe
+from squidpy.utils import get_array, ask_socket, read_pipe, setup_matplotlib
 from squidpy.instrument import create_instruments_from_pipes, RemoteInstrument, InstrumentList
-from squidpy.data import DataCollector, Data
-from IPython import display
-from pylab import pause
+from squidpy.plan import Plan, orders
+from squidpy.cache import SetpointTracker
+from squidpy.adaptive import AdaptiveGrid
+from squidpy.transport import BatchSender
 import time
 import re
-import pylab as pl
-import numpy as np
-import seaborn as sns
 import asyncio
-from IPython import display
-import pandas as pd
 import logging
 import asyncio
 import gc
@@ -24,9 +20,19 @@ class Measurement(ctx.Process):
     def __init__(self, instruments, measlist = [], *args, **kwargs):
         super(Measurement, self).__init__()
         self.pipe = Pipe() # data pipe
-        self.instrument_pipes = instruments.get_pipes()
+        self.use_instruments(instruments)
         self.measlist = measlist
+        self.plan = None
+        # Checkpoint of an interrupted run to resume, see Experiment.resume
+        self.resume_from = None
+        # Progress, shared with the experiment in the main process
+        self.points_done = ctx.Value('l', 0)
+        self.started = ctx.Value('d', 0.)
     
+    def use_instruments(self, instruments):
+        '''Take the pipes of an InstrumentList to the measurement process.'''
+        self.instrument_pipes = instruments.get_pipes()
+
     def set(self, *args, **kwargs):
         '''
         Add keyword argument as measurement type 
@@ -45,66 +51,368 @@ class Measurement(ctx.Process):
             return self.instruments.get_datapoint(params)
     
     def do_measurement(self, measlist):
-        if len(measlist)>0:
-            meas = measlist.pop(0)
-            if meas['type']=='do':
-                do_func, args = meas['params']
-                if hasattr(self.instruments, 's'):
-                    ask_socket(self.instruments.s, '%s(*%s)' %(do_func, args))
-                else:
-                    eval('%s(*%s)' %(do_func, args))
-                self.do_measurement(measlist.copy())
-            if meas['type']=='sweep':
-                self.recursive_sweep(measlist.copy(), *meas['params'])
-            if meas['type']=='sweep_custom':
-                self.recursive_sweep_custom(measlist.copy(), *meas['params'])
-            if meas['type']=='do_while':
-                clause = 'self.instruments.' + meas['params']
-                while eval(clause):
-                    self.do_measurement(measlist.copy())
-            if meas['type']=='measure':
-                dp = self.get_dp(meas['params'])
-                self.pipe[0].send(dp)
-                self.do_measurement(measlist.copy())
-    
-    def recursive_sweep_custom(self, measlist, ins, param, arr):
-        [self.set_param_and_run_next(measlist, ins, param, val) for val in arr]
+        '''Compile measlist into a Plan and run it.'''
+        self.run_plan(Plan(measlist))
 
-    def recursive_sweep(self, measlist, ins, param, start, stop, step):
-        [self.set_param_and_run_next(measlist, ins, param, val) for val in get_array(start, stop, step)]
+    def run_plan(self, plan):
+        plan.bind(self, globals())
+        self.plan = plan
+        self.setpoints = SetpointTracker(self.instruments)
+        # Scheduler state: when the written setpoints have settled, and the readout in flight
+        self._settled = 0.
+        self._reading = None
+        self.schedule = {'settle_wait': 0., 'overlapped': 0}
+        # Adaptive grids waiting for the datapoints of their points, in measurement order
+        self._observers = []
+        # Statistics and the last (time, value) of do_while conditions
+        self.conditions = {}
+        self._evaluated = {}
+        # Completed measure, buffered and adaptive steps, counting those of the run before it was resumed
+        self.steps_done = self.resume_from['steps'] if self.resume_from else 0
+        self.sender = BatchSender(self.pipe[0])
+        plan.run(self, skip=self.steps_done)
+        self.barrier()
+        self.sender.close()
+
+    def _step_done(self):
+        '''Count a completed step and checkpoint the run with the datapoints sent so far.'''
+        self.steps_done += 1
+        self.sender.checkpoint({'steps': self.steps_done,
+                                'points': self.points_done.value,
+                                'measlist': self.measlist})
+
+    def _settle_time(self, sets):
+        '''Settle time (s) of the slowest of the setpoints [(ins, param, value)].'''
+        return max([self.instruments.todict[ins]._settle_time.get(param, 0) for ins, param, value in sets] + [0])
+
+    def _ramped(self, ins, param):
+        '''True if the driver of ins declares a ramp rate or step for param, see Instrument.ramp.'''
+        ins = self.instruments.todict[ins]
+        return param in ins._ramp_rate or param in ins._ramp_step
+
+    def _read_time(self, params):
+        '''
+        Time (s) the instruments take to read params, from the drivers' _read_time.
+        Instruments read their parameters one after the other and concurrently with each other.
+        None if a driver does not declare the read time of one of the parameters.
+        '''
+        total = 0
+        for ins in params:
+            read_time = self.instruments.todict[ins]._read_time
+            if any(param not in read_time for param in params[ins]):
+                return None
+            total = max(total, sum(read_time[param] for param in params[ins]))
+        return total
+
+    def write(self, sets):
+        '''Write setpoints [(ins, param, value)] that changed, to different instruments concurrently.'''
+        sets = self.setpoints.filter(sets)
+        if len(sets) > 0:
+            self._write(sets)
+
+    def _write(self, sets):
+        '''
+        Write sets concurrently and move the settle deadline.
+        Parameters with a declared ramp are ramped, ramps on different instruments run at the same
+        time and are all done before the next reading. The readout in flight is overlapped if it does not read any of the instruments written to,
+        once its readings have been taken. Otherwise it is completed first.
+        '''
+        if self._reading is not None:
+            reading, acquired = self._reading[0], self._reading[2]
+            if any(ins in reading for ins, param, value in sets):
+                self._finish_reading()
+            else:
+                if acquired > time.monotonic():
+                    time.sleep(acquired - time.monotonic())
+                self.schedule['overlapped'] += 1
+        transaction = self.instruments.transaction()
+        for ins, param, value in sets:
+            if self._ramped(ins, param):
+                transaction.ramp(ins, param, value)
+            else:
+                transaction.set(ins, param, value)
+        request_ids = transaction.send()
+        self._finish_reading()
+        transaction.receive(request_ids)
+        self._settled = max(self._settled, time.monotonic() + self._settle_time(sets))
+
+    def _finish_reading(self):
+        '''Wait for the readout in flight and send its datapoint.'''
+        if self._reading is None:
+            return
+        reading, request_ids, acquired, tags, step = self._reading
+        self._reading = None
+        dp = {}
+        for results in reading.receive(request_ids).values():
+            dp.update(results[0])
+        dp.update(tags)
+        self.send_datapoint(dp)
+        if step:
+            self._step_done()
+
+    def barrier(self):
+        '''Complete the readout in flight and wait for the written setpoints to settle.'''
+        self._finish_reading()
+        wait = self._settled - time.monotonic()
+        if wait > 0:
+            self.schedule['settle_wait'] += wait
+            time.sleep(wait)
+
+    def do(self, call):
+        self.barrier()
+        call()
+        # A function can change any setting behind the tracker's back
+        self.setpoints.forget()
+
+    def _condition_stats(self, node):
+        if node.clause not in self.conditions:
+            self.conditions[node.clause] = {'evaluations': 0, 'reused': 0, 'time': 0., 'watch_polls': 0, 'waited': 0.}
+        return self.conditions[node.clause]
+
+    def _evaluate(self, node):
+        '''Evaluate a do_while condition, after the datapoints so far have been taken.'''
+        self.barrier()
+        stats = self._condition_stats(node)
+        t0 = time.perf_counter()
+        value = node.condition()
+        stats['time'] += time.perf_counter() - t0
+        stats['evaluations'] += 1
+        self._evaluated[node.clause] = (time.monotonic(), value)
+        return value
+
+    def evaluate(self, node, entering=False):
+        '''
+        Value of the condition of a do_while loop, evaluated on every pass. With the min_interval
+        option it is evaluated at most once per min_interval s, in between the loop goes on with
+        the last value. A loop that is entered or left starts afresh.
+        '''
+        if entering:
+            self._evaluated.pop(node.clause, None)
+        elif node.clause in self._evaluated:
+            evaluated, value = self._evaluated[node.clause]
+            if time.monotonic() - evaluated < node.options['min_interval']:
+                self._condition_stats(node)['reused'] += 1
+                return value
+        value = self._evaluate(node)
+        if not value:
+            self._evaluated.pop(node.clause, None)
+        return value
+
+    def wait_while(self, node):
+        '''
+        Wait for the condition of a do_while without loop body to become false. A condition on a single
+        instrument is watched by its daemon (see RemoteInstrument.watch), other conditions are polled
+        here. Either way the poll interval grows by backoff up to max_interval.
+        '''
+        self.barrier()
+        stats = self._condition_stats(node)
+        options = node.options
+        t0 = time.perf_counter()
+        result = None
+        if node.watch is not None:
+            ins, expression = node.watch
+            result = self.instruments.todict[ins].watch('not (%s)' %expression, options['interval'], options['backoff'], options['max_interval'])
+        if result is not None:
+            stats['watch_polls'] += result['polls']
+            stats['time'] += result['time']
+        else:
+            interval = options['interval']
+            while self._evaluate(node):
+                time.sleep(interval)
+                interval = min(interval*options['backoff'], options['max_interval'])
+        stats['waited'] += time.perf_counter() - t0
+
+    def measure(self, params, sets=[], tags={}, step=True):
+        '''
+        Write the pending setpoints that changed, read out a datapoint with tags added to it and
+        send it to the data collector. The datapoint completes a step of the plan if step is True.
+        Readings start when all setpoints have settled, see the drivers' _settle_time.
+        If the drivers declare the _read_time of all parameters, the readout is left in flight:
+        setpoints of other instruments at the next step are written as soon as the readings
+        have been taken, without waiting for the replies.
+        '''
+        sets = self.setpoints.filter(sets)
+        params = params or self.instruments.all()
+        read_time = self._read_time(params)
+        if read_time is None:
+            if len(sets) == 1 and self._settle_time(sets) == 0 and not self._ramped(*sets[0][:2]):
+                self.barrier()
+                # Set and read out in one transaction
+                dp = self.instruments.set_and_get_datapoint(*sets[0], params=params)
+            else:
+                if len(sets) > 0:
+                    self._write(sets)
+                self.barrier()
+                dp = self.get_dp(params)
+            dp.update(tags)
+            self.send_datapoint(dp)
+            if step:
+                self._step_done()
+            return
+        if len(sets) > 0:
+            self._write(sets)
+        self.barrier()
+        reading = self.instruments.transaction()
+        for ins in params:
+            reading.call(ins, 'get_datapoint', params[ins])
+        self._reading = (reading, reading.send(), time.monotonic() + read_time, tags, step)
+
+    def send_datapoint(self, dp):
+        if len(self._observers) > 0:
+            grid, sweep, point, observe = self._observers.pop(0)
+            for (ins, param, values, min_step), value in zip(sweep, point):
+                dp.setdefault('%s.%s' %(ins, param), value)
+            grid.tell(point, dp.get(observe))
+        self.sender.send(dp)
+        with self.points_done.get_lock():
+            self.points_done.value += 1
+
+    def buffered_sweep(self, params, ins, param, start, stop, step, tags={}):
+        '''
+        Run the sweep on the instrument itself with its buffered_sweep function and
+        send one datapoint per setpoint, with the same columns as a software sweep.
+        Other instruments with an arm_buffer function take one buffered reading per setpoint,
+        parameters that are not buffered are read once after the sweep.
+        '''
+        self.barrier()
+        params = params or self.instruments.all()
+        setpoints = get_array(start, stop, step)
+        # The instrument leaves the swept parameter at the end of the sweep
+        self.setpoints.forget(ins, param)
+        readouts = [name for name in params if name != ins and 'arm_buffer' in self.instruments.todict[name]._functions]
+        for name in readouts:
+            self.instruments.todict[name].arm_buffer(len(setpoints))
+        buffers = {name: {} for name in params}
+        buffers[ins] = self.instruments.todict[ins].buffered_sweep(param, start, stop, step)
+        for name in readouts:
+            buffers[name] = self.instruments.todict[name].fetch_buffer()
+        unbuffered = {name: [p for p in params[name] if p not in buffers[name]] for name in params}
+        dp_static = self.get_dp({name: unbuffered[name] for name in unbuffered if len(unbuffered[name])>0})
+        for i in range(len(setpoints)):
+            dp = dict(dp_static)
+            dp.update(tags)
+            for name in params:
+                for p in params[name]:
+                    if p in buffers[name]:
+                        dp['%s.%s' %(name, p)] = buffers[name][p][i]
+            self.send_datapoint(dp)
+        self._step_done()
+
+    def stream(self, ins, func, args, samples, columns, tags={}):
+        '''
+        Let the daemon of ins call func(*args) in a loop (see RemoteInstrument.stream) and send the first
+        samples rows of the blocks it returns, with one value per column, to the data collector.
+        The tags, e.g. the setpoints of the enclosing sweeps, are added to every row as constant columns.
+        The blocks are copied out of shared memory and sent through the data pipe as whole batches,
+        pickled as arrays without a dict per sample; the data collector does not read the shared memory itself.
+        '''
+        import numpy as np
+        self.barrier()
+        ring = self.instruments.todict[ins].stream(func, args, width=len(columns))
+        names = ['%s.%s' %(ins, column) for column in columns]
+        received = 0
+        try:
+            while received < samples:
+                if ring.available == 0:
+                    if ring.finished:
+                        logging.warning('Stream %s.%s ended after %d of %d samples' %(ins, func, received, samples))
+                        break
+                    time.sleep(1e-3)
+                    continue
+                block = ring.read(samples - received)
+                columns = {name: block[:, i] for i, name in enumerate(names)}
+                columns.update({tag: np.full(len(block), value) for tag, value in tags.items()})
+                self.sender.send_block(columns)
+                received += len(block)
+                with self.points_done.get_lock():
+                    self.points_done.value += len(block)
+        finally:
+            ring.stop()
+            ring.close()
+        self._step_done()
+
+    def adaptive_sweep(self, params, sweep, options, tags={}):
+        '''
+        Measure the coarse grid of the adaptive sweeps [(ins, param, values, min_step)] and refine it
+        where options['observe'] changes fastest, see squidpy.adaptive.AdaptiveGrid.
+        The swept parameters are added to datapoints that do not read them.
+        '''
+        grid = AdaptiveGrid([values for ins, param, values, min_step in sweep],
+                            [min_step for ins, param, values, min_step in sweep],
+                            options.get('budget'), options.get('tol'), options.get('criterion', 'gradient'))
+        while True:
+            # The next points depend on all datapoints so far
+            self.barrier()
+            points = grid.ask()
+            if len(points) == 0:
+                break
+            for point in points:
+                self._observers.append((grid, sweep, point, options['observe']))
+                self.measure(params, [(ins, param, value) for (ins, param, values, min_step), value in zip(sweep, point)], tags, step=False)
+        # All datapoints have been sent by the barrier before the last ask
+        self._step_done()
+
+    def get_metadata(self):
+        '''Measurement list, timing and command statistics of the instruments, saved with the data.'''
+        return {'measlist': self.measlist,
+                'started': self.started.value,
+                'finished': time.time(),
+                'points': self.points_done.value,
+                'setpoints': self.setpoints.stats(),
+                'schedule': self.schedule,
+                'conditions': self.conditions,
+                'instruments': self.instruments.stats()}
 
-    def set_param_and_run_next(self, measlist, ins, param, val):
-        setattr(self.instruments.todict[ins], param, val)
-        self.do_measurement(measlist.copy())
-    
     def end_measurement(self):
         self.pipe[0].send(None)
         [pipe.close() for pipe in self.pipe]
 
     def run(self):
         self.instruments = create_instruments_from_pipes(self.instrument_pipes)
-        self.do_measurement(self.measlist.copy())
+        # Start the command statistics afresh, so the metadata covers this measurement only
+        self.instruments.stats(reset=True)
+        self.started.value = time.time()
+        if self.resume_from:
+            self.points_done.value = self.resume_from['points']
+        self.run_plan(self.plan or Plan(self.measlist))
+        self.pipe[0].send(('metadata', self.get_metadata()))
         self.end_measurement()
 
 class Sweep(object):
-        def __init__(self, experiment, ins, param, arr = []):
+        def __init__(self, experiment, ins, param, arr = [], buffered=False, adaptive=None, order=None):
+            if order not in orders:
+                raise ValueError('Unknown sweep order %s, use one of %s' %(order, orders))
             self.ins = ins
             self.param = param
             self.experiment = experiment
+            self.buffered = buffered
+            self.adaptive = adaptive
+            self.order = order
             if len(arr)>0:
-                self.experiment.set(sweep_custom = (self.ins, self.param, arr))
+                if buffered:
+                    raise ValueError('Buffered sweeps only support start:stop:step ranges.')
+                self.experiment.set(sweep_custom = (self.ins, self.param, arr) + ((order,) if order else ()))
 
         def __getitem__(self, s):
-            self.experiment.set(sweep = (self.ins, self.param, 
-                                 s.start, s.stop, s.step))
+            if self.adaptive is not None:
+                self.experiment.set(sweep_adaptive = (self.ins, self.param, s.start, s.stop, s.step, self.adaptive))
+                return
+            if self.buffered:
+                self.experiment.set(sweep_buffered = (self.ins, self.param, s.start, s.stop, s.step))
+            else:
+                self.experiment.set(sweep = (self.ins, self.param, s.start, s.stop, s.step) + ((self.order,) if self.order else ()))
 
 class Experiment():
     '''
     Basic experiment class. This class creates the measurement, plot and data collector. It runs the measurement in a separate process, which drops datapoints in a queue.
     The datacollector, also in a separate process, is a daemon that collects all these datapoints in a Data (pd.Dataframe-like) object and saves the data periodically on-disk.
     It also drops the latest Data instance in a pipe for live plotting in the main thread.
+    pandas and the plotting libraries are imported when they are first needed, so the spawned
+    Measurement process does not load them.
     '''
     def __init__(self, title, measlist=[]):
+        import pandas as pd
+        from squidpy.data import DataCollector
         self.title = title
         self.instruments = InstrumentList(*RemoteInstrument.instances)
         self.manager = Manager()
@@ -118,6 +426,7 @@ class Experiment():
     
     @property
     def data(self):
+        from squidpy.data import Data
         if 'data' in self.output.keys():
             if hasattr(self, '_data'):
                 del self._data
@@ -136,6 +445,7 @@ class Experiment():
             if not running:
                 if len(self.plots)>0:
                     if self.plots[0]['type'] is not 'pcolor':
+                        from IPython import display
                         display.clear_output(wait=True)
             return running
         except KeyboardInterrupt:
@@ -167,6 +477,7 @@ class Experiment():
             pass
     
     def plot(self, *args, **kwargs):
+        setup_matplotlib()
         kwargs['title'] = self.wait_and_get_title()
         ax = self.data.plot(*args, **kwargs)
         self.plots.append({'type': 'plot', 'args': args, 'kwargs': kwargs, 'ax': ax})
@@ -175,6 +486,7 @@ class Experiment():
         self._user_interrupt = False
 
     def clear_plot(self):
+        import pylab as pl
         for fig in self.figs:
             fig.clf()
             pl.close()
@@ -183,6 +495,7 @@ class Experiment():
         gc.collect()
 
     def update_plot(self):
+        from IPython import display
         try:
             loop = asyncio.get_event_loop()
             tasks = []
@@ -209,13 +522,16 @@ class Experiment():
             display.display(*self.figs)
             self._user_interrupt = True
     
+    def _grid(self, xname, yname, zname):
+        '''z on the grid of measured x and y values, sorted, with NaN where nothing was measured yet.'''
+        return self._data.pivot_table(index=yname, columns=xname, values=zname)
+
     def pcolor(self, xname, yname, zname, *args, **kwargs):
+        import pylab as pl
+        import seaborn as sns
+        setup_matplotlib()
         title = self.wait_and_get_title()
-        x,y,z = self._data[xname], self._data[yname], self._data[zname]
-        shape = (len(y.unique()), len(x.unique()))
-        diff = shape[0]*shape[1] - len(z)
-        Z = np.concatenate((z.values, np.zeros(diff))).reshape(shape)
-        df = pd.DataFrame(Z, index=y.unique(), columns=x.unique())
+        df = self._grid(xname, yname, zname)
         ax = sns.heatmap(df)
         pl.title(title)
         pl.xlabel(xname)
@@ -226,21 +542,16 @@ class Experiment():
         if ax.get_figure() not in self.figs:
             self.figs.append(ax.get_figure())
     
-    @asyncio.coroutine
-    def update_pcolor(self, ax, xname, yname, zname):
-        x,y,z = self._data[xname], self._data[yname], self._data[zname]
-        shape = (len(y.unique()), len(x.unique()))
-        diff = shape[0]*shape[1] - len(z)
-        Z = np.concatenate((z.values, np.zeros(diff))).reshape(shape)
-        df = pd.DataFrame(Z, index=y.unique(), columns=x.unique())
+    async def update_pcolor(self, ax, xname, yname, zname):
+        import seaborn as sns
+        df = self._grid(xname, yname, zname)
         cbar_ax = ax.get_figure().axes[1]
         sns.heatmap(df, ax=ax, cbar_ax=cbar_ax)
         ax.set_xlabel(xname)
         ax.set_ylabel(yname)
         ax.invert_yaxis()
     
-    @asyncio.coroutine
-    def update_line(self, ax, hl, xname, yname):
+    async def update_line(self, ax, hl, xname, yname):
         del hl._xorig, hl._yorig
         hl.set_xdata(self._data[xname])
         hl.set_ydata(self._data[yname])
@@ -251,15 +562,54 @@ class Experiment():
     def set(self, **kwargs):
         self.measurement.set(**kwargs)
 
-    def sweep(self, sweep_param, arr=[]):
+    def sweep(self, sweep_param, arr=[], buffered=False, order=None):
+        '''
+        Sweep a parameter, e.g. sweep('keithley.voltage')[0:1:0.01].
+        With buffered=True the instrument runs the whole sweep from its own buffer
+        (see the buffered_sweep functions of the Keithley drivers).
+        order='serpentine' runs every other pass of a nested sweep backwards instead of returning
+        to the start, order='min_travel' also sorts the values of arr into the shortest path.
+        Datapoints of ordered sweeps get a '<ins>.<param>.index' column with the position in the grid.
+        '''
+        ins, param = re.split('\.', sweep_param)
+        return Sweep(self, ins, param, arr, buffered, order=order)
+
+    def sweep_adaptive(self, sweep_param, observe, budget=None, tol=None, criterion='gradient', min_step=None):
+        '''
+        Adaptive sweep, e.g. sweep_adaptive('keithley.current', 'nanovolt.voltage', budget=200)[0:1e-3:1e-4].
+        The start:stop:step grid is measured first, then points are added where observe changes
+        fastest (criterion 'gradient') or bends most ('curvature'), until budget points have been
+        taken, no interval has a loss above tol, or the intervals are down to min_step (default step/16).
+        Two adaptive sweeps in a row refine a 2D grid by adding whole rows and columns.
+        See squidpy.adaptive.AdaptiveGrid.
+        '''
         ins, param = re.split('\.', sweep_param)
-        return Sweep(self, ins, param, arr)
+        return Sweep(self, ins, param, adaptive={'observe': observe, 'budget': budget, 'tol': tol,
+                                                 'criterion': criterion, 'min_step': min_step})
 
-    def do_while(self, clause):
-        self.set(do_while = clause)
+    def do_while(self, clause, interval=.1, backoff=1.5, max_interval=2., min_interval=0):
+        '''
+        Repeat the steps that follow while clause is true, e.g. do_while('ppms.temperature > 10').
+        The clause is evaluated before every pass, or at most every min_interval s if that is given,
+        for clauses that are slow to evaluate. Without steps to repeat, the experiment waits
+        for the clause to become false, polling every interval s, slowing down by backoff per poll
+        up to max_interval s. A clause on one instrument is then watched by the instrument's daemon.
+        '''
+        self.set(do_while = (clause, {'interval': interval, 'backoff': backoff, 'max_interval': max_interval,
+                                      'min_interval': min_interval}))
     
     def do(self, func, *args):
         self.set(do = (func, args))
+
+    def stream(self, source, samples, columns, args=()):
+        '''
+        Take samples from source, a function of an instrument daemon that returns blocks of samples,
+        e.g. stream('nidaq.read_block', 100000, ['ai0'], ('ai0',)), with one value per column in
+        every row. The samples come from the daemon through shared memory and reach the data collector
+        in whole blocks, tagged with the setpoints of the enclosing sweeps, see Measurement.stream.
+        '''
+        ins, func = re.split('\.', source)
+        self.set(stream = (ins, func, tuple(args), samples, list(columns)))
     
     def measure(self, params=None):
         self.set(measure = params)
@@ -267,7 +617,8 @@ class Experiment():
     def run(self):
         if self.measurement.measlist is []:
             raise NameError('Measurement is not defined.')
-        if 'measure' not in [meas['type'] for meas in self.measurement.measlist]:
+        from squidpy.data import DataCollector
+        if not any(meas['type'] in ['measure', 'stream'] for meas in self.measurement.measlist):
             print('Warning: No \'measure\' command found.')
         if self.measurement.pid is not None:
             measlist = self.measurement.measlist
@@ -278,10 +629,72 @@ class Experiment():
             self.datacollector = DataCollector(self.measurement.pipe[1],
                                                 self.output,
                                                 self.title)
+        # Compiled here so that mistakes in the measurement list show up before anything runs
+        plan = self.plan
+        plan.check(self.instruments.all())
+        self.measurement.plan = plan
         if not self.datacollector.is_alive():
             self.datacollector.start()
         if not self.measurement.is_alive():
             self.measurement.start()
+
+    def resume(self, stamp=None, folder='data'):
+        '''
+        Resume the interrupted run with stamp (default: the last run of this experiment) from its checkpoint.
+        The measure, buffered and adaptive steps it completed are skipped, the setpoints of the sweeps
+        are written again and the new datapoints are appended to the same data file. A buffered or
+        adaptive sweep that was cut short is taken again from its start, and so are the do steps
+        after the last completed step.
+        Without a measurement list, the one of the checkpoint is used.
+        '''
+        import json
+        from squidpy.data import DataCollector, load_checkpoint, read_data, to_json
+        if self.measurement.is_alive():
+            raise RuntimeError('The measurement is still running.')
+        stamp = stamp or self.output.get('stamp')
+        checkpoint = load_checkpoint(folder, stamp, self.title)
+        measlist = self.measurement.measlist
+        if len(measlist) == 0:
+            measlist = checkpoint['measlist']
+        elif json.loads(json.dumps(measlist, default=to_json)) != checkpoint['measlist']:
+            raise ValueError('The measurement list differs from the one of run %s.' %stamp)
+        plan = Plan(measlist)
+        if not plan.resumable:
+            raise ValueError('Run %s has do_while loops around its measurements and cannot be resumed.' %stamp)
+        plan.check(self.instruments.all())
+        self.measurement = Measurement(self.instruments, measlist)
+        self.measurement.resume_from = checkpoint
+        self.measurement.plan = plan
+        if self.datacollector.is_alive():
+            self.datacollector.terminate()
+        self.output.clear()
+        self.output.update({'title': self.title, 'folder': folder, 'stamp': stamp,
+                            'data': read_data(folder, stamp, self.title, checkpoint['points'])})
+        self.datacollector = DataCollector(self.measurement.pipe[1], self.output, self.title, folder, stamp,
+                                           resume_points=checkpoint['points'])
+        self.datacollector.start()
+        self.measurement.start()
+
+    @property
+    def plan(self):
+        '''The execution plan of the measurement list, see squidpy.plan.Plan.'''
+        return Plan(self.measurement.measlist)
+
+    @property
+    def progress(self):
+        '''Datapoints taken and the total (None if a do_while loop decides).'''
+        return self.measurement.points_done.value, self.plan.n_points
+
+    @property
+    def eta(self):
+        '''Estimated seconds until the measurement is done, None if unknown.'''
+        done, total = self.progress
+        # Datapoints taken before a resume do not count towards the rate
+        before = self.measurement.resume_from['points'] if self.measurement.resume_from else 0
+        if total is None or done <= before:
+            return None
+        elapsed = time.time() - self.measurement.started.value
+        return elapsed/(done - before)*(total - done)
     
     def __del__(self):
         self.manager.shutdown()
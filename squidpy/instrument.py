@@ -1,17 +1,24 @@
 import time
+import math
 import asyncio
-import numpy as np
 import re
 from multiprocessing import Process, Pipe
-from squidpy.utils import ask_socket, ask_pipe, read_pipe, set_logging_config
+from multiprocessing.connection import wait
+from squidpy.utils import ask_socket, send_request, reply_value, set_logging_config
+from squidpy.utils import GET, SET, CALL, CLOSE, BATCH, STREAM, WATCH, ATTACH, OK, ERROR, INVALIDATE, OPCODE_NAMES
 import asyncio
 import inspect
 import logging
 import types
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from squidpy.cache import ParameterCache, UNTIL_SET
+from squidpy.profiling import CommandStats
+from squidpy import visabus
 from squidpy import instruments as instruments_module
 
 def instrument(class_name, *args, **kwargs):
-    instrument_class = getattr(instruments_module, class_name)
+    instrument_class = instruments_module.get_driver(class_name)
     ins_proc = InstrumentDaemon(instrument_class, *args, **kwargs)
     ins = RemoteInstrument(ins_proc._pipe_out)
     return ins
@@ -23,26 +30,174 @@ def create_instruments_from_pipes(pipes):
         instruments.append(ins)
     return instruments
 
+def execute_request(instrument, opcode, name, args, kwargs):
+    '''Execute a protocol request on an instrument and return the result.'''
+    if opcode == GET:
+        if name in instrument._params:
+            return instrument._get_cached(name)
+        return getattr(instrument, name)
+    elif opcode == SET:
+        if name in instrument._params:
+            setattr(instrument, name, args[0])
+        else:
+            logging.warning('Instrument %s does not have attribute %s.' %(instrument._name, name))
+        return True
+    elif opcode == CALL:
+        return getattr(instrument, name)(*args, **kwargs)
+    elif opcode == BATCH:
+        results = []
+        for request in args[0]:
+            try:
+                t0 = time.perf_counter()
+                results.append(execute_request(instrument, *request))
+                if instrument._command_stats is not None:
+                    instrument._command_stats.record(command_name(request[0], request[1]), execute=time.perf_counter() - t0)
+            except Exception as e:
+                logging.warning('Command \'%s\' in batch failed: %s' %(request[1], e))
+                results.append(None)
+        return results
+    elif opcode == STREAM:
+        ring, func_args, func_kwargs = args
+        thread = threading.Thread(target=stream_to_ring, args=(getattr(instrument, name), ring, func_args, func_kwargs))
+        thread.daemon = True
+        thread.start()
+        return True
+    raise ValueError('Unknown opcode %s' %opcode)
+
+def command_name(opcode, name):
+    '''Key of a command in CommandStats, e.g. 'get voltage'.'''
+    if name is None:
+        return OPCODE_NAMES[opcode]
+    return '%s %s' %(OPCODE_NAMES[opcode], name)
+
+def stream_to_ring(func, ring, args=(), kwargs={}):
+    '''Write the results of func to ring until the consumer stops the stream.'''
+    try:
+        while not ring.stopped:
+            ring.write(func(*args, **kwargs))
+    except Exception as e:
+        logging.warning('Stream stopped: %s' %e)
+    finally:
+        ring.finish()
+        # Detach the daemon's copy, the consumer frees the memory
+        ring.close()
+
 class Instrument(object):
     '''
     Instrument base class.
     '''
+    # Methods of the base class that are not exposed as remote instrument functions
+    _base_functions = ['get_datapoint', 'refresh', 'cache_stats', 'invalidate_cache', 'bus_stats', 'command_stats', 'ramp']
+    # Cache policy per parameter, see squidpy.cache.ParameterCache
+    _cache_policy = {}
+    # Set to True in drivers whose parameters can be read out in parallel threads
+    _independent_params = False
+    # Absolute tolerance per parameter within which a setpoint counts as unchanged, see squidpy.cache.SetpointTracker
+    _tolerance = {}
+    # Parameters that are written at every setpoint, also when the value did not change
+    _rewrite = []
+    # Seconds to wait after setting a parameter before readings are valid
+    _settle_time = {}
+    # Seconds it takes the instrument to take a reading of a parameter, see Measurement.measure
+    _read_time = {}
+    # Maximum rate (units/s) and step per parameter at which Instrument.ramp changes it
+    _ramp_rate = {}
+    _ramp_step = {}
+    # Command timing, set by serve_instrument when the instrument is served from a pipe
+    _command_stats = None
+
     def __init__(self, name, *args, **kwargs):
         super(Instrument, self).__init__()
         self._params = [a[0] for a in inspect.getmembers(type(self), lambda a: type(a)==property)]
         self._name = name
-        self._functions = [f[0] for f in inspect.getmembers(type(self), lambda a:type(a) == types.FunctionType) if (not(f[0].startswith('_')) and not(f[0] == 'get_datapoint') and not(f[0] == 'refresh'))]
+        self._functions = [f[0] for f in inspect.getmembers(type(self), lambda a:type(a) == types.FunctionType) if (not(f[0].startswith('_')) and not(f[0] in Instrument._base_functions))]
+        self._get_cache()
+
+    def __setattr__(self, name, value):
+        super(Instrument, self).__setattr__(name, value)
+        if not name.startswith('_') and '_cache' in self.__dict__:
+            self._cache.set(name, value)
+
+    def _get_cache(self):
+        '''Return the parameter cache, created from the driver's _cache_policy.'''
+        if '_cache' not in self.__dict__:
+            self._cache = ParameterCache(self._cache_policy)
+        return self._cache
+
+    def _get_cached(self, param):
+        return self._get_cache().get(param, lambda: self._read_param(param))
+
+    def _read_param(self, param):
+        if self._command_stats is None:
+            return getattr(self, param)
+        t0 = time.perf_counter()
+        value = getattr(self, param)
+        self._command_stats.record('read %s' %param, execute=time.perf_counter() - t0)
+        return value
 
     def get_datapoint(self, params):
-        datapoint = {}
-        for param in params:
-            datapoint['%s.%s' %(self._name, param)] = getattr(self, param)
-        return datapoint
+        if self._independent_params and len(params) > 1:
+            if '_executor' not in self.__dict__:
+                self._executor = ThreadPoolExecutor(max_workers=len(self._params))
+            values = self._executor.map(self._get_cached, params)
+        else:
+            values = [self._get_cached(param) for param in params]
+        return {'%s.%s' %(self._name, param): value for param, value in zip(params, values)}
 
     def refresh(self):
         for param in self._params:
-            getattr(self, param)
+            self._get_cached(param)
         return self
+
+    def ramp(self, param, value, rate=None, step=None):
+        '''
+        Change param to value in steps of at most step, at no more than rate units/s.
+        The rate and step default to the driver's _ramp_rate and _ramp_step. Without either
+        the value is set at once, without a rate the steps are set as fast as the instrument takes them.
+        '''
+        rate = self._ramp_rate.get(param) if rate is None else rate
+        step = self._ramp_step.get(param) if step is None else step
+        if (rate is not None and rate <= 0) or (step is not None and step <= 0):
+            raise ValueError('Ramp rate and step of %s must be positive, not %s and %s.' %(param, rate, step))
+        if rate is None and step is None:
+            setattr(self, param, value)
+            return value
+        start = float(getattr(self, param))
+        distance = value - start
+        if step is None:
+            # Twenty steps per second
+            step = rate/20.
+        n_steps = max(int(math.ceil(abs(distance)/step)), 1)
+        interval = abs(distance)/n_steps/rate if rate else 0
+        t0 = time.monotonic()
+        for i in range(1, n_steps):
+            setattr(self, param, start + distance*i/n_steps)
+            wait = t0 + i*interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+        setattr(self, param, value)
+        return value
+
+    def cache_stats(self):
+        '''Return the number of cache hits and misses.'''
+        return self._get_cache().stats()
+
+    def invalidate_cache(self, param=None):
+        '''Invalidate the cached value of param, or of all parameters.'''
+        self._get_cache().invalidate(param)
+
+    def bus_stats(self):
+        '''Utilisation of the VISA buses in the process this instrument runs in.'''
+        return visabus.bus_stats()
+
+    def command_stats(self, reset=False):
+        '''Latency histograms of the commands served for this instrument, see squidpy.profiling.CommandStats.'''
+        if self._command_stats is None:
+            return {}
+        stats = self._command_stats.summary()
+        if reset:
+            self._command_stats.reset()
+        return stats
     
     def _repr_html_(self):
         '''
@@ -60,7 +215,7 @@ class Instrument(object):
             if hasattr(self, '_' + key):
                 value = getattr(self,'_'+key)
             else:
-                value = getattr(self, key)
+                value = self._get_cached(key)
             html.append("<tr>")
             html.append("<td>{0}</td>".format(key))
             html.append("<td>{0} {1}</td>".format(value, unit))
@@ -86,57 +241,229 @@ class InstrumentDaemon(Process):
         self._pipe = Pipe()
         self._pipe_out = self._pipe[1]
         self.daemon = True
-        self.running = True
         self.start()
         InstrumentDaemon.instances.append(self)
 
     def run(self):
         # Create instrument
         instrument = self._instrument_class(*self._args, **self._kwargs)
-        pipe = self._pipe[0]
-        while self.running:
-            while not pipe.poll():
-                time.sleep(0.01)
-            else:
-                cmd = pipe.recv()
-                if not cmd: break
-                logging.debug(instrument._name + '.' + cmd)
-                if cmd == 'close':
-                    self.running = False
-                    pipe.send('None')
-                else:
-                    try:
-                        if '=' in cmd:
-                            cmd = cmd.replace(' =','=')
-                            cmd = cmd.replace('= ','=')
-                            param, value = re.split('=',cmd)
-                            if param in instrument._params:
-                                setattr(instrument, param, eval(value))
-                            else:
-                                logging.warning('Instrument %s does not have attribute %s.' %(instrument._name, param))
-                            response = 'True'
-                        elif '(' in cmd:
-                            response = eval('instrument.' + cmd)
-                        else:
-                            response = str(getattr(instrument, cmd))
-                        pipe.send(response)
-                    except Exception as e:
-                        logging.warning('Command \'%s\' not recognized: %s' %(cmd, e))
-                        pipe.send('None')
+        serve_instrument(instrument, self._pipe[0])
 
     def __del__(self):
         self._pipe[0].close()
         self.exitcode
 
+class InstrumentHost(Process):
+    '''
+    Process that hosts many instruments, each served by its own thread.
+    Meant for I/O-bound drivers: it saves the startup time and memory of one process per
+    instrument, and instruments on the same GPIB board share one VisaBus.
+    host.instrument() returns the same RemoteInstrument proxy as squidpy.instrument.instrument().
+    '''
+    instances = []
+
+    def __init__(self):
+        super(InstrumentHost, self).__init__()
+        self._control = Pipe()
+        self.daemon = True
+        self.start()
+        InstrumentHost.instances.append(self)
+
+    def instrument(self, class_name, *args, **kwargs):
+        '''Create an instrument in the host process and return its proxy.'''
+        pipe = Pipe()
+        self._control[1].send((class_name, args, kwargs, pipe[0]))
+        error = self._control[1].recv()
+        if error is not None:
+            raise RuntimeError('Could not create %s: %s' %(class_name, error))
+        return RemoteInstrument(pipe[1])
+
+    def run(self):
+        control = self._control[0]
+        while True:
+            try:
+                class_name, args, kwargs, pipe = control.recv()
+            except EOFError:
+                break
+            try:
+                instrument = instruments_module.get_driver(class_name)(*args, **kwargs)
+            except Exception as e:
+                control.send(str(e))
+                continue
+            thread = threading.Thread(target=serve_instrument, args=(instrument, pipe), name=instrument._name)
+            thread.daemon = True
+            thread.start()
+            control.send(None)
+
+class Watch(object):
+    '''
+    Condition on the parameters of an instrument, e.g. "temperature_status == 'stable'", evaluated
+    by serve_instrument between requests. The first evaluation is immediate, after that the interval
+    grows by backoff up to max_interval. The watch ends when the condition is true or after timeout s.
+    '''
+    def __init__(self, request_id, instrument, condition, interval, backoff, max_interval, timeout):
+        self.request_id = request_id
+        self.instrument = instrument
+        self.code = compile(condition, '<watch>', 'eval')
+        self.interval = interval
+        self.backoff = backoff
+        self.max_interval = max_interval
+        self.next = time.monotonic()
+        self.deadline = self.next + timeout
+        self.polls = 0
+        self.time = 0.
+        self.done = False
+
+    def poll(self):
+        '''Evaluate the condition, returns True when the watch is over.'''
+        t0 = time.perf_counter()
+        namespace = {name: self.instrument._get_cached(name) if name in self.instrument._params else getattr(self.instrument, name)
+                     for name in self.code.co_names if hasattr(type(self.instrument), name)}
+        self.done = bool(eval(self.code, {}, namespace))
+        self.time += time.perf_counter() - t0
+        self.polls += 1
+        now = time.monotonic()
+        if self.done or now >= self.deadline:
+            return True
+        self.next = now + self.interval
+        self.interval = min(self.interval*self.backoff, self.max_interval)
+        return False
+
+    def result(self):
+        return {'done': self.done, 'polls': self.polls, 'time': self.time, 'interval': self.interval}
+
+def written_params(opcode, name, args):
+    '''Parameters that a request writes to.'''
+    if opcode == SET:
+        return [name]
+    elif opcode == CALL and name == 'ramp':
+        return [args[0]]
+    elif opcode == BATCH:
+        return [param for request in args[0] for param in written_params(*request[:3])]
+    return []
+
+def serve_instrument(instrument, pipe):
+    '''
+    Answer protocol requests for instrument from pipe until it is closed.
+    Other processes get pipes of their own with ATTACH requests (see RemoteInstrument.attach),
+    requests from all pipes are executed one at a time and answered on the pipe they came from.
+    An attached pipe is dropped when its other end is closed.
+    Watches are evaluated while no request is waiting, each is answered when it ends.
+    The queue wait, execution and reply time of every command are recorded in instrument._command_stats.
+    Parameters that a command invalidated in the instrument's cache are announced before its reply,
+    on the other pipes also the parameters it wrote to.
+    '''
+    stats = instrument._command_stats = CommandStats()
+    cache = instrument._get_cache()
+    cache.invalidations = []
+    pipes = [pipe]
+    watches = []
+    def drop(conn):
+        pipes.remove(conn)
+        watches[:] = [(watch, other) for watch, other in watches if other is not conn]
+        conn.close()
+    while True:
+        timeout = max(min(watch.next for watch, conn in watches) - time.monotonic(), 0) if len(watches) > 0 else None
+        ready = wait(pipes, timeout)
+        if len(ready) == 0:
+            for watch, conn in [(watch, conn) for watch, conn in watches if watch.next <= time.monotonic()]:
+                try:
+                    t0 = time.perf_counter()
+                    if watch.poll():
+                        watches.remove((watch, conn))
+                        conn.send((watch.request_id, OK, watch.result()))
+                    stats.record('watch', execute=time.perf_counter() - t0)
+                except Exception as e:
+                    logging.warning('Watch could not be evaluated: %s' %e)
+                    watches.remove((watch, conn))
+                    conn.send((watch.request_id, ERROR, str(e)))
+            continue
+        for conn in [conn for conn in ready if conn in pipes]:
+            try:
+                request_id, opcode, name, args, kwargs, sent = conn.recv()
+            except (EOFError, OSError):
+                if conn is pipe:
+                    return
+                drop(conn)
+                continue
+            queue = time.monotonic() - sent
+            t0 = time.perf_counter()
+            logging.debug('%s.%s %s %s', instrument._name, name, opcode, args)
+            if opcode == CLOSE:
+                conn.send((request_id, OK, None))
+                if conn is pipe:
+                    return
+                drop(conn)
+                continue
+            if opcode == ATTACH:
+                pipes.append(args[0])
+                conn.send((request_id, OK, True))
+                continue
+            if opcode == WATCH:
+                try:
+                    watches.append((Watch(request_id, instrument, name, *args), conn))
+                except Exception as e:
+                    conn.send((request_id, ERROR, str(e)))
+                continue
+            try:
+                status, value = OK, execute_request(instrument, opcode, name, args, kwargs)
+            except Exception as e:
+                logging.warning('Command \'%s\' not recognized: %s' %(name, e))
+                status, value = ERROR, str(e)
+            t1 = time.perf_counter()
+            invalidated = cache.pop_invalidations()
+            if len(invalidated) > 0:
+                conn.send((None, INVALIDATE, invalidated))
+            if len(pipes) > 1:
+                changed = invalidated + written_params(opcode, name, args)
+                if len(changed) > 0:
+                    for other in [other for other in pipes if other is not conn]:
+                        try:
+                            other.send((None, INVALIDATE, changed))
+                        except OSError:
+                            drop(other)
+            try:
+                conn.send((request_id, status, value))
+            except OSError:
+                # The process at the other end of an attached pipe ended
+                if conn is pipe:
+                    raise
+                drop(conn)
+                continue
+            except Exception as e:
+                logging.warning('Reply to \'%s\' could not be sent: %s' %(name, e))
+                conn.send((request_id, ERROR, str(e)))
+            stats.record(command_name(opcode, name), queue, t1 - t0, time.perf_counter() - t1)
+
 class RemoteInstrument(Instrument):
+    '''
+    Proxy for an instrument running in an InstrumentDaemon or behind a Server socket.
+    Parameters that the driver's _cache_policy caches until set are cached on the client side as well,
+    they are refreshed by sets through this proxy and dropped when the daemon invalidates them.
+    Parameters cached for a time are only cached in the daemon, so their values are never older than that.
+    Every process should use a pipe of its own, see attach.
+    '''
     instances = []
+    __setattr__ = object.__setattr__
+
     def __init__(self, pipe=None, socket=None, name=None):
         self._pipe = pipe
         self._socket = socket
         self._name = name
+        self._pending = {}
+        self._reader = False
+        # Empty until the policies are known, invalidations may arrive with the first replies
+        self._cache = ParameterCache()
+        self._cache.policy = {param: policy for param, policy in self._get_param('_cache_policy').items() if policy == UNTIL_SET}
         self._params = self._get_param('_params')
         self._functions = self._get_param('_functions')
         self._units = self._get_param('_units')
+        self._tolerance = self._get_param('_tolerance')
+        self._rewrite = self._get_param('_rewrite')
+        self._settle_time = self._get_param('_settle_time')
+        self._read_time = self._get_param('_read_time')
+        self._ramp_rate = self._get_param('_ramp_rate')
+        self._ramp_step = self._get_param('_ramp_step')
         self.__doc__ = self._get_param('__doc__')
         self._repr_html_ = lambda: self._get_func('_repr_html_')
         for param in self._params:
@@ -153,6 +480,8 @@ class RemoteInstrument(Instrument):
         return self._name
 
     def _get_func(self, func, *args, **kwargs):
+        if self._pipe is not None:
+            return self._request(CALL, func, *args, **kwargs)
         cmd = '%s(' %func
         for arg in args:
             if type(arg) == str:
@@ -163,27 +492,309 @@ class RemoteInstrument(Instrument):
         return self._ask(cmd)
     
     def _get_param(self, param):
+        if '_cache' in self.__dict__:
+            return self._cache.get(param, lambda: self._get_param_uncached(param))
+        return self._get_param_uncached(param)
+
+    def _get_param_uncached(self, param):
+        if self._pipe is not None:
+            return self._request(GET, param)
         return self._ask(param)
 
     def _set_param(self, param, value):
+        self._cache.set(param, value)
+        if self._pipe is not None:
+            return self._request(SET, param, value)
         if type(value) == str:
             cmd = "%s = '%s'" %(param, value)
         else:
             cmd = '%s = %s' %(param, value)
         self._ask(cmd)
 
+    def _request(self, opcode, name=None, *args, **kwargs):
+        return self._receive(self._send(opcode, name, *args, **kwargs))
+
+    def _send(self, opcode, name=None, *args, **kwargs):
+        '''Send a request and return its request id.'''
+        return send_request(self._pipe, opcode, name, *args, **kwargs)
+
+    def _recv(self):
+        reply = self._pipe.recv()
+        while reply[0] is None and reply[1] == INVALIDATE:
+            for param in reply[2]:
+                self._cache.invalidate(param)
+            reply = self._pipe.recv()
+        return reply
+
+    def _receive(self, request_id, strict=False):
+        '''
+        Read replies until the one for request_id arrives, handing replies awaited by coroutines over to them.
+        A failed request returns None, or raises RuntimeError with the instrument's error if strict.
+        '''
+        while True:
+            reply_id, status, value = self._recv()
+            if reply_id == request_id:
+                if strict and status == ERROR:
+                    raise RuntimeError('%s: %s' %(self._name, value))
+                return reply_value(reply_id, status, value)
+            self._dispatch(reply_id, status, value)
+
+    async def _request_async(self, opcode, name=None, *args, **kwargs):
+        request_id = self._send(opcode, name, *args, **kwargs)
+        return await self._receive_async(request_id)
+
+    def _receive_async(self, request_id):
+        '''Return a future for the reply to request_id.'''
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        self._pending[request_id] = future
+        if len(self._pending) == 1:
+            self._watch_pipe(loop)
+        return future
+
+    def _watch_pipe(self, loop):
+        '''Dispatch replies as soon as the pipe becomes readable, without polling.'''
+        try:
+            loop.add_reader(self._pipe.fileno(), self._dispatch_replies, loop)
+            self._reader = True
+        except NotImplementedError:
+            # Event loops without add_reader (Windows) wait for data in a worker thread
+            self._reader = False
+            waiter = loop.run_in_executor(None, self._pipe.poll, None)
+            waiter.add_done_callback(lambda future: self._dispatch_replies(loop))
+
+    def _dispatch_replies(self, loop):
+        while len(self._pending) > 0 and self._pipe.poll():
+            self._dispatch(*self._recv())
+        if len(self._pending) == 0:
+            if self._reader:
+                loop.remove_reader(self._pipe.fileno())
+                self._reader = False
+        elif not self._reader:
+            self._watch_pipe(loop)
+
+    def _dispatch(self, reply_id, status, value):
+        future = self._pending.pop(reply_id, None)
+        if future is not None and not future.cancelled():
+            future.set_result(reply_value(reply_id, status, value))
+
+    async def get_datapoint_async(self, params):
+        '''Coroutine that reads out params without blocking the event loop.'''
+        if self._pipe is None:
+            return self.get_datapoint(params)
+        return await self._request_async(CALL, 'get_datapoint', params)
+
     def _ask(self, cmd):
-        if self._pipe is not None:
-            return ask_pipe(self._pipe, cmd)
-        elif self._socket is not None:
+        if self._socket is not None:
             return ask_socket(self._socket, self._name + '.' + cmd)
 
+    def cache_stats(self):
+        '''Return cache hits and misses of this proxy and of the instrument in its daemon.'''
+        stats = self._cache.stats()
+        if self._pipe is not None:
+            stats['daemon'] = self._get_func('cache_stats')
+        return stats
+
+    def invalidate_cache(self, param=None):
+        '''Invalidate cached values in this proxy and in the daemon.'''
+        self._cache.invalidate(param)
+        if self._pipe is not None:
+            self._get_func('invalidate_cache', param)
+
+    def stream(self, func, args=(), kwargs=None, capacity=2**16, width=1, dtype='float64', mode='block'):
+        '''
+        Let the daemon call func(*args, **kwargs) in a loop and write the returned sample blocks
+        to a shared-memory RingBuffer, which is returned. Call stop() on the buffer to end the stream.
+        Other requests are served while streaming, so func must tolerate concurrent use of the driver.
+        '''
+        if self._pipe is None:
+            raise NotImplementedError('Streaming is only available for instruments in a daemon process.')
+        from squidpy.ringbuffer import RingBuffer
+        ring = RingBuffer(capacity, width, dtype, mode)
+        self._request(STREAM, func, ring, args, kwargs or {})
+        return ring
+
+    def watch(self, condition, interval=.1, backoff=1.5, max_interval=2., timeout=1.):
+        '''
+        Wait until condition, an expression of the instrument's parameters such as
+        "temperature_status == 'stable'", is true. The daemon evaluates it (see Watch) and answers
+        when it is true or after timeout s, then the request is repeated, so a shared pipe is not
+        held for long. Returns the number of evaluations and their total time, or None if the
+        condition cannot be watched by the daemon.
+        '''
+        if self._pipe is None:
+            return None
+        polls, elapsed = 0, 0.
+        while True:
+            result = self._request(WATCH, condition, interval, backoff, max_interval, timeout)
+            if result is None:
+                return None
+            polls += result['polls']
+            elapsed += result['time']
+            interval = result['interval']
+            if result['done']:
+                return {'polls': polls, 'time': elapsed}
+
+    def ramp(self, param, value, rate=None, step=None):
+        '''Ramp param to value in the daemon, see Instrument.ramp. Returns when the ramp is done.'''
+        self._cache.set(param, value)
+        return self._get_func('ramp', param, value, rate, step)
+
+    def attach(self):
+        '''
+        Proxy for the instrument on a new pipe to its daemon, for use in another process.
+        The daemon serves its pipes one request at a time, so processes need not coordinate
+        their use of the instrument, and drops the pipe when the process at the other end ends.
+        '''
+        if self._pipe is None:
+            return self
+        local, remote = Pipe()
+        self._request(ATTACH, None, remote)
+        remote.close()
+        ins = RemoteInstrument(local, name=self._name)
+        # Not an instrument of its own for new experiments
+        RemoteInstrument.instances.remove(ins)
+        return ins
+
+    def bus_stats(self):
+        '''Utilisation of the VISA buses in the daemon process of this instrument.'''
+        return self._get_func('bus_stats')
+
+    def command_stats(self, reset=False):
+        '''Latency histograms of the commands the daemon served for this instrument.'''
+        return self._get_func('command_stats', reset)
+
+    def transaction(self):
+        '''Start a transaction that sends queued gets, sets and calls to the daemon in one message.'''
+        return Transaction(self)
+
+    def _close(self):
+        if self._pipe is not None:
+            return self._request(CLOSE)
+        return self._ask('close')
+
+class Transaction(object):
+    '''
+    Queue of gets, sets and function calls on a RemoteInstrument.
+    The queue is sent to the instrument daemon as a single BATCH request, which runs
+    the commands in order and returns all results in one reply.
+    Can be used as a context manager, the results are then stored in self.results.
+    '''
+    def __init__(self, instrument):
+        self.instrument = instrument
+        self.requests = []
+        self.results = None
+
+    def get(self, param):
+        self.requests.append((GET, param, (), {}))
+        return self
+
+    def set(self, param, value):
+        self.requests.append((SET, param, (value,), {}))
+        return self
+
+    def call(self, func, *args, **kwargs):
+        self.requests.append((CALL, func, args, kwargs))
+        return self
+
+    def ramp(self, param, value, rate=None, step=None):
+        return self.call('ramp', param, value, rate, step)
+
+    def send(self):
+        '''Send the queued commands without waiting for the reply. Returns the request id.'''
+        # Write the sets through first, so invalidations announced with the reply take precedence
+        for opcode, name, args, kwargs in self.requests:
+            if opcode == SET:
+                self.instrument._cache.set(name, args[0])
+            elif opcode == CALL and name == 'ramp':
+                self.instrument._cache.set(args[0], args[1])
+        return self.instrument._send(BATCH, None, self.requests)
+
+    def receive(self, request_id, strict=False):
+        self.results = self.instrument._receive(request_id, strict)
+        return self.results
+
+    def execute(self, strict=False):
+        '''Run the queued commands and return their results. If strict, a failed batch raises RuntimeError.'''
+        if self.instrument._pipe is None:
+            self.results = [self._execute_single(*request) for request in self.requests]
+            return self.results
+        return self.receive(self.send(), strict)
+
+    def _execute_single(self, opcode, name, args, kwargs):
+        if opcode == GET:
+            return self.instrument._get_param(name)
+        elif opcode == SET:
+            return self.instrument._set_param(name, *args)
+        return self.instrument._get_func(name, *args, **kwargs)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
+class InstrumentListTransaction(dict):
+    '''
+    Transactions on several instruments of an InstrumentList.
+    All batches are sent before any reply is awaited, so the daemons work on them concurrently.
+    '''
+    def __init__(self, instruments):
+        super(InstrumentListTransaction, self).__init__()
+        self.instruments = instruments
+        self.results = None
+
+    def __getitem__(self, ins_name):
+        if ins_name not in self:
+            self[ins_name] = self.instruments.todict[ins_name].transaction()
+        return super(InstrumentListTransaction, self).__getitem__(ins_name)
+
+    def get(self, ins_name, param):
+        return self[ins_name].get(param)
+
+    def set(self, ins_name, param, value):
+        return self[ins_name].set(param, value)
+
+    def call(self, ins_name, func, *args, **kwargs):
+        return self[ins_name].call(func, *args, **kwargs)
+
+    def ramp(self, ins_name, param, value, rate=None, step=None):
+        return self[ins_name].ramp(param, value, rate, step)
+
+    def send(self):
+        '''Send the transactions of all instruments with a pipe without waiting. Returns the request ids.'''
+        return {ins_name: transaction.send() for ins_name, transaction in self.items()
+                if transaction.instrument._pipe is not None}
+
+    def receive(self, request_ids):
+        '''Wait for the replies to send(), execute the other transactions and return the results per instrument.'''
+        self.results = {}
+        for ins_name, transaction in self.items():
+            if ins_name in request_ids:
+                self.results[ins_name] = transaction.receive(request_ids[ins_name])
+            else:
+                self.results[ins_name] = transaction.execute()
+        return self.results
+
+    def execute(self):
+        '''Execute all transactions and return their results per instrument.'''
+        return self.receive(self.send())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.execute()
+
 class InstrumentList(list):
     '''
     Instrument list class. Show an overview of all instruments.
     '''
     def __init__(self, *instruments, socket=None):
         super(InstrumentList, self).__init__(instruments)
+        self._engine = None
         self.set_attributes()
         if socket is not None:
             self.s = socket
@@ -209,44 +820,75 @@ class InstrumentList(list):
                 datapoint.update(self.get_parameter(ins_name, param_name))
         return datapoint
 
+    @property
+    def engine(self):
+        '''Acquisition engine with a long-lived event loop, created on first use.'''
+        if self._engine is None:
+            self._engine = AcquisitionEngine(self)
+        return self._engine
+
     def get_datapoint_async(self, params=None):
         '''
-        Get datapoint by sending out requests to all instrument daemons.
-        Only act asynchronous between instruments. Parameters per instrument are obtained synchronously.
+        Get datapoint by sending out requests to all instrument daemons at once
+        and merging the replies as they arrive.
+        '''
+        return self.engine.get_datapoint(params)
+
+    async def get_parameter_async(self, ins_name, params):
+        return await self.todict[ins_name].get_datapoint_async(params)
+
+    def set_and_get_datapoint(self, ins_name, param, value, params=None):
+        '''
+        Set a parameter and read out a datapoint in as few round trips as possible.
+        The set and the readout of the same instrument go out as one transaction.
+        The other instruments are read concurrently once the set has been acknowledged.
         '''
-        global datapoint
         if params is None:
             params = self.all()
+        transaction = self.todict[ins_name].transaction().set(param, value)
+        if ins_name in params:
+            transaction.call('get_datapoint', params[ins_name])
+        # Raises the instrument's error if the batch failed as a whole
+        results = transaction.execute(strict=True)
         datapoint = {}
-        loop = asyncio.get_event_loop()
-        tasks = []
-        for ins_name in params:
-            tasks.append(asyncio.ensure_future(self.get_parameter_async(ins_name, params[ins_name])))
-        loop.run_until_complete(asyncio.wait(tasks))
+        if ins_name in params and results[1] is not None:
+            datapoint.update(results[1])
+        others = {key: params[key] for key in params if key != ins_name}
+        if len(others) > 0:
+            datapoint.update(self.get_datapoint_async(others))
         return datapoint
 
-    @asyncio.coroutine
-    def get_parameter_async(self, ins, params):
-        global datapoint
-        pipe, cmd = self.get_pipe_and_cmd(ins, params)
-        pipe.send(cmd)
-        while not pipe.poll():
-            yield from asyncio.sleep(0.01)
-        datapoint.update(read_pipe(pipe))
+    def set_parameters(self, sets):
+        '''Set parameters [(ins_name, param, value)], on different instruments concurrently.'''
+        with self.transaction() as transaction:
+            for ins_name, param, value in sets:
+                transaction.set(ins_name, param, value)
+
+    def ramp(self, *ramps):
+        '''
+        Ramp parameters (ins_name, param, value), see Instrument.ramp, and return when all ramps are done.
+        Ramps on different instruments run at the same time, those on one instrument one after another.
+        '''
+        with self.transaction() as transaction:
+            for ins_name, param, value in ramps:
+                transaction.ramp(ins_name, param, value)
+
+    def transaction(self):
+        '''Start transactions on several instruments that are executed concurrently.'''
+        return InstrumentListTransaction(self)
 
     def get_parameter(self, ins_name, param_name):
         ins = self.todict[ins_name]
         return {'%s.%s' %(ins_name, param_name): getattr(ins, param_name)}
 
-    def get_pipe_and_cmd(self, ins_name, params):
-        ins = self.todict[ins_name]
-        cmd = 'get_datapoint(%s)' %params
-        return ins._pipe, cmd
-
     def all(self):
         '''Return all parameters per instrument in a dictionary.'''
         return {ins._name: ins._params for ins in self}
 
+    def stats(self, reset=False):
+        '''Command latency histograms per instrument, see Instrument.command_stats.'''
+        return {ins._name: ins.command_stats(reset) for ins in self}
+
     def append(self, *args):
         super(InstrumentList, self).append(*args)
         self.set_attributes()
@@ -262,4 +904,36 @@ class InstrumentList(list):
 
     def close(self):
         for ins in self:
-            ins._ask('close')
\ No newline at end of file
+            ins._close()
+        if self._engine is not None:
+            self._engine.close()
+
+class AcquisitionEngine(object):
+    '''
+    Reads datapoints from the instruments of an InstrumentList.
+    Requests to all instruments go out at once and their replies are awaited concurrently
+    on a single event loop that lives as long as the engine.
+    '''
+    def __init__(self, instruments):
+        self.instruments = instruments
+        self.loop = asyncio.new_event_loop()
+
+    def run(self, coroutine):
+        return self.loop.run_until_complete(coroutine)
+
+    def get_datapoint(self, params=None):
+        '''Read out params ({instrument: [parameters]}) and return one merged datapoint.'''
+        return self.run(self.get_datapoint_async(params))
+
+    async def get_datapoint_async(self, params=None):
+        if params is None:
+            params = self.instruments.all()
+        datapoints = await asyncio.gather(*[self.instruments.get_parameter_async(ins_name, params[ins_name]) for ins_name in params])
+        datapoint = {}
+        for dp in datapoints:
+            if dp is not None:
+                datapoint.update(dp)
+        return datapoint
+
+    def close(self):
+        self.loop.close()
\ No newline at end of file
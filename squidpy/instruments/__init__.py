@@ -1,11 +1,41 @@
-from .mock_instrument import *
-from .keithley import *
-try:
-    from .ni import *
-except ImportError:
-    pass
-from .ppms import *
-from .timer import *
-from .montana import *
-from .yokogawa import *
-from .srs import *
\ No newline at end of file
+'''
+Instrument drivers.
+Drivers are imported lazily: squidpy.instruments.Keithley2400 (or instrument('Keithley2400', ...))
+imports only the keithley module and its dependencies, not visa/instrumental for every other driver.
+'''
+import importlib
+
+# Driver class -> module it lives in. Modules without a dot are relative to squidpy.instruments.
+_drivers = {
+    'Mock': 'mock_instrument',
+    'Keithley2182A': 'keithley',
+    'Keithley6220': 'keithley',
+    'Keithley2400': 'keithley',
+    'Keithley7001': 'keithley',
+    'Keithley2600': 'keithley',
+    'NIDAQ': 'ni',
+    'PPMS': 'ppms',
+    'Timer': 'timer',
+    'MontanaCryostation': 'montana',
+    'Yokogawa7651': 'yokogawa',
+    'SR830': 'srs',
+}
+
+def register_driver(class_name, module):
+    '''Make a driver class from another module available to instrument(), e.g. register_driver('Lakeshore', 'mylab.lakeshore').'''
+    _drivers[class_name] = module
+
+def get_driver(class_name):
+    '''Import the module of a driver and return its class.'''
+    if class_name not in _drivers:
+        raise AttributeError('Unknown instrument driver %s' %class_name)
+    module = _drivers[class_name]
+    if '.' not in module:
+        module = '%s.%s' %(__name__, module)
+    return getattr(importlib.import_module(module), class_name)
+
+def __getattr__(name):
+    return get_driver(name)
+
+def __dir__():
+    return sorted(list(globals()) + list(_drivers))
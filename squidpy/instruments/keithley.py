@@ -1,5 +1,8 @@
 from squidpy.instrument import Instrument
-import visa
+from squidpy.cache import UNTIL_SET
+from squidpy.utils import get_array
+import numpy
+from squidpy.visabus import open_resource
 
 
 class Keithley2182A(Instrument):
@@ -7,10 +10,11 @@ class Keithley2182A(Instrument):
     Instrument driver for Keithley 2182A Nanovoltmeter
     '''
     def __init__(self, gpib_address='', name='keithleynano'):
-        rm = visa.ResourceManager()
-        self._visa_handle = rm.open_resource(gpib_address)
+        self._visa_handle = open_resource(gpib_address)
         self._visa_handle.read_termination = '\n'
         self._units = {'voltage': 'V', 'range': 'V'}
+        # range changes by itself when autorange is on, so it is only cached briefly
+        self._cache_policy = {'nplc': UNTIL_SET, 'range': 1}
         super(Keithley2182A, self).__init__(name)
         self._visa_handle.write(':CONF:VOLT:DC')
         self._visa_handle.write('*RST')
@@ -44,6 +48,27 @@ class Keithley2182A(Instrument):
     def autorange(self, value):
         status = 'ON' if (value==True or (value==1) or (value=='on')) else 'OFF'
         self._visa_handle.write('SENS:VOLT:RANG:AUTO %s' %status)
+        self.invalidate_cache('range')
+
+    def arm_buffer(self, points):
+        '''Arm the reading buffer to store one reading per external trigger (e.g. from a Keithley6220 sweep).'''
+        self._visa_handle.write(':TRAC:CLE')
+        self._visa_handle.write(':TRAC:POIN %d' %points)
+        self._visa_handle.write(':TRAC:FEED SENS')
+        self._visa_handle.write(':TRAC:FEED:CONT NEXT')
+        self._visa_handle.write(':TRIG:SOUR EXT')
+        self._visa_handle.write(':TRIG:COUN %d' %points)
+        self._visa_handle.write(':INIT')
+
+    def fetch_buffer(self):
+        '''Read the buffer in one binary transfer and return {'voltage': array}.'''
+        self._visa_handle.write(':FORM:DATA SRE')
+        self._visa_handle.write(':FORM:BORD SWAP')
+        voltage = self._visa_handle.query_binary_values(':TRAC:DATA?', datatype='f', is_big_endian=False, container=numpy.array)
+        self._visa_handle.write(':FORM:DATA ASC')
+        self._visa_handle.write(':TRIG:SOUR IMM')
+        self._visa_handle.write(':TRIG:COUN 1')
+        return {'voltage': voltage}
 
     def __del__(self):
         self._visa_handle.close()
@@ -53,7 +78,7 @@ class Keithley6220(Instrument):
     Instrument driver for Keithley 6220 DC current source
     '''
     def __init__(self, gpib_address='',  name='currentsource'):
-        self._visa_handle = visa.ResourceManager().open_resource(gpib_address)
+        self._visa_handle = open_resource(gpib_address)
         self._visa_handle.read_termination = '\n'
         self._units = {'current': 'A', 'compliance': 'A'}
         super(Keithley6220, self).__init__(name)
@@ -99,6 +124,33 @@ class Keithley6220(Instrument):
         self._visa_handle.write('SOUR:SWE:ARM')
         self._visa_handle.write('INIT')
 
+    def buffered_sweep(self, param, start, stop, step, delay=1e-3):
+        '''
+        Run a linear current sweep on the instrument and wait for it to finish.
+        A trigger is sent over the trigger link after every step, so an armed Keithley2182A
+        buffer takes one reading per setpoint. Returns {'current': setpoints}.
+        '''
+        if param != 'current':
+            raise ValueError('Keithley6220 can only sweep current.')
+        setpoints = get_array(start, stop, step)
+        self._visa_handle.write('SOUR:SWE:SPAC LIN')
+        self._visa_handle.write('SOUR:CURR:STAR %s' %setpoints[0])
+        self._visa_handle.write('SOUR:CURR:STOP %s' %setpoints[-1])
+        self._visa_handle.write('SOUR:CURR:STEP %s' %(setpoints[1]-setpoints[0] if len(setpoints)>1 else step))
+        self._visa_handle.write('SOUR:DEL %s' %delay)
+        self._visa_handle.write('SOUR:SWE:COUN 1')
+        self._visa_handle.write('SOUR:SWE:CAB OFF')
+        self._visa_handle.write('TRIG:OUTP DEL')
+        self._visa_handle.write('SOUR:SWE:ARM')
+        self._visa_handle.write('INIT')
+        timeout = self._visa_handle.timeout
+        self._visa_handle.timeout = timeout + 2*len(setpoints)*delay*1e3
+        try:
+            self._visa_handle.ask('*OPC?')
+        finally:
+            self._visa_handle.timeout = timeout
+        return {'current': setpoints}
+
     def __del__(self):
         self._visa_handle.close()
 
@@ -109,7 +161,7 @@ class Keithley2400(Instrument):
     def __init__(self, gpib_address='', name='sourcemeter'):
         self._units = {'current': 'A',
                       'voltage': 'V'}
-        self._visa_handle = visa.ResourceManager().open_resource(gpib_address)
+        self._visa_handle = open_resource(gpib_address)
         self._visa_handle.read_termination = '\n'
         super(Keithley2400, self).__init__(name)
         
@@ -159,6 +211,40 @@ class Keithley2400(Instrument):
     def output(self, value):
         status = 'ON' if ((value==True) or (value==1) or (value=='on')) else 'OFF'
         self._visa_handle.write('OUTP %s' %status)
+
+    def buffered_sweep(self, param, start, stop, step, delay=0, nplc=1):
+        '''
+        Run a linear voltage or current sweep on the instrument and read all readings back
+        in one binary transfer. Returns arrays for the setpoints (param), 'voltage_in' and 'current'
+        ('current_in' when sweeping current). nplc is the integration time of every reading in power line cycles.
+        The data elements and format are restored after the sweep.
+        '''
+        func = {'voltage': 'VOLT', 'current': 'CURR'}[param]
+        setpoints = get_array(start, stop, step)
+        elements = self._visa_handle.ask(':FORM:ELEM?').strip()
+        self._visa_handle.write(':SOUR:FUNC %s' %func)
+        self._visa_handle.write(':SOUR:%s:STAR %s' %(func, setpoints[0]))
+        self._visa_handle.write(':SOUR:%s:STOP %s' %(func, setpoints[-1]))
+        self._visa_handle.write(':SOUR:SWE:POIN %d' %len(setpoints))
+        self._visa_handle.write(':SOUR:%s:MODE SWE' %func)
+        self._visa_handle.write(':SOUR:DEL %s' %delay)
+        self._visa_handle.write(':SENS:CURR:NPLC %s' %nplc)
+        self._visa_handle.write(':TRIG:COUN %d' %len(setpoints))
+        self._visa_handle.write(':FORM:ELEM VOLT,CURR')
+        self._visa_handle.write(':FORM:DATA SRE')
+        self._visa_handle.write(':FORM:BORD SWAP')
+        # :READ? returns when the whole sweep is done
+        timeout = self._visa_handle.timeout
+        self._visa_handle.timeout = timeout + 2*len(setpoints)*(delay + nplc/50.)*1e3
+        try:
+            data = self._visa_handle.query_binary_values(':READ?', datatype='f', is_big_endian=False, container=numpy.array)
+        finally:
+            self._visa_handle.timeout = timeout
+            self._visa_handle.write(':FORM:DATA ASC')
+            self._visa_handle.write(':FORM:ELEM %s' %elements)
+            self._visa_handle.write(':TRIG:COUN 1')
+            self._visa_handle.write(':SOUR:%s:MODE FIX' %func)
+        return {param: setpoints, 'voltage_in': data[0::2], 'current_in' if param == 'current' else 'current': data[1::2]}
     
     def __del__(self):
         self._visa_handle.close()
@@ -168,7 +254,7 @@ class Keithley7001(Instrument):
     Instrument driver for Keithley 7001 Switch system
     '''
     def __init__(self, gpib_address='',  name='keithleyswitch'):
-        self._visa_handle = visa.ResourceManager().open_resource(gpib_address)
+        self._visa_handle = open_resource(gpib_address)
         self._visa_handle.read_termination = '\n'
         self._configs = {}
         super(Keithley7001, self).__init__(name)
@@ -190,14 +276,32 @@ class Keithley7001(Instrument):
     def configs(self):
         return self._configs
 
+_TSP_SWEEP = '''loadscript squidpySweepScript
+function squidpy_sweep(smu, source, start, step, points, delay_time, nplc)
+    smu.measure.nplc = nplc
+    smu.nvbuffer1.clear()
+    smu.nvbuffer2.clear()
+    smu.nvbuffer1.appendmode = 1
+    smu.nvbuffer2.appendmode = 1
+    if source == 'v' then smu.source.func = smu.OUTPUT_DCVOLTS else smu.source.func = smu.OUTPUT_DCAMPS end
+    for i = 0, points - 1 do
+        if source == 'v' then smu.source.levelv = start + i*step else smu.source.leveli = start + i*step end
+        delay(delay_time)
+        smu.measure.iv(smu.nvbuffer1, smu.nvbuffer2)
+    end
+    waitcomplete()
+end
+endscript'''
+
 class Keithley2600(Instrument):
     '''
     Instrument driver for Keithley 2600-model Source Meter (tested with 2636A)
     '''
     def __init__(self, gpib_address='', name='sourcemeter'):
         self._units = {'current': 'A','voltage': 'V'}
-        self._visa_handle = visa.ResourceManager().open_resource(gpib_address)
+        self._visa_handle = open_resource(gpib_address)
         self._visa_handle.read_termination = '\n'
+        self._scripts = []
         super(Keithley2600, self).__init__(name)
         
     @property
@@ -313,6 +417,43 @@ class Keithley2600(Instrument):
     def resetB(self):
         '''Resets the B channel'''
         self._visa_handle.write('smub.reset()')
+
+    def load_script(self, name, source):
+        '''Upload a TSP script (loadscript ... endscript) and run it once, e.g. to define its functions.'''
+        for line in source.splitlines():
+            self._visa_handle.write(line)
+        self._visa_handle.write('%s.run()' %name)
+        self._scripts.append(name)
+
+    def buffered_sweep(self, param, start, stop, step, delay=0, nplc=1):
+        '''
+        Run a linear sweep of param (e.g. 'voltageA') with a TSP script on the instrument,
+        measuring current and voltage into smuX.nvbuffer1/2 at every step. Both buffers are read
+        back in one binary transfer. Returns {'currentX': array, 'voltageX': array}.
+        '''
+        channel = param[-1]
+        smu = 'smu%s' %channel.lower()
+        source = {'voltage': 'v', 'current': 'i'}[param[:-1]]
+        setpoints = get_array(start, stop, step)
+        points = len(setpoints)
+        if 'squidpySweepScript' not in self._scripts:
+            self.load_script('squidpySweepScript', _TSP_SWEEP)
+        timeout = self._visa_handle.timeout
+        self._visa_handle.timeout = timeout + 2*points*(delay + nplc/50.)*1e3
+        try:
+            self._visa_handle.write('squidpy_sweep(%s, "%s", %s, %s, %d, %s, %s)' %(smu, source,
+                                    setpoints[0], setpoints[1]-setpoints[0] if points>1 else 0, points, delay, nplc))
+            self._visa_handle.query('waitcomplete() print(1)')
+        finally:
+            self._visa_handle.timeout = timeout
+        self._visa_handle.write('format.data = format.REAL32')
+        self._visa_handle.write('format.byteorder = format.LITTLEENDIAN')
+        try:
+            data = self._visa_handle.query_binary_values('printbuffer(1, %d, %s.nvbuffer1.readings, %s.nvbuffer2.readings)' %(points, smu, smu),
+                                                         datatype='f', is_big_endian=False, container=numpy.array)
+        finally:
+            self._visa_handle.write('format.data = format.ASCII')
+        return {'current%s' %channel: data[0::2], 'voltage%s' %channel: data[1::2]}
     
     def __del__(self):
         self._visa_handle.close()
\ No newline at end of file
@@ -16,6 +16,10 @@ class Mock(Instrument):
                       'output_voltage': 'V',
                       'time': 's',
                       'wave': 'a.u.'}
+        self._independent_params = True
+        # Setting time waits for it, so it is written at every setpoint
+        self._rewrite = ['time']
+        self._read_time = {'voltage': wait, 'output_voltage': 0, 'time': 0, 'wave': 0}
         super(Mock, self).__init__(name)
         
     @property
@@ -49,6 +53,10 @@ class Mock(Instrument):
         """Get wave."""
         return float(numpy.sin(self.time))
 
+    def read_block(self, n_samples=1000):
+        '''Get n_samples of the wave at 1 ms intervals, as an array of shape (n_samples, 1).'''
+        return numpy.sin(self.time + 1e-3*numpy.arange(n_samples)).reshape(-1, 1)
+
     @property
     def voltage(self):
         """Get the voltage."""
@@ -1,3 +1,4 @@
+import numpy
 from squidpy.instrument import Instrument
 from instrumental.drivers.daq import ni
 
@@ -25,4 +26,13 @@ class NIDAQ(Instrument):
 	
 	def set_chan(self, chan, value):
 		setattr(self, '_%s' %chan, value)
-		getattr(self._daq,chan).write('%sV' %value)
\ No newline at end of file
+		getattr(self._daq,chan).write('%sV' %value)
+
+	def read_block(self, chan, n_samples=1000, fsamp=10000):
+		'''
+		Acquire n_samples from an analog input channel at fsamp (Hz) in one buffered read.
+		Returns an array of shape (n_samples, 1), e.g. for RemoteInstrument.stream('read_block', ('ai0',)).
+		'''
+		data = getattr(self._daq, chan).read(n_samples=n_samples, fsamp='%sHz' %fsamp)
+		values = [data[key] for key in data if key != 't'][0]
+		return numpy.asarray(values.magnitude).reshape(-1, 1)
\ No newline at end of file
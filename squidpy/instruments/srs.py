@@ -1,13 +1,20 @@
 from squidpy.instrument import Instrument
-import visa
+from squidpy.cache import UNTIL_SET
+import numpy
+from squidpy.visabus import open_resource
 
 class SR830(Instrument):
     '''
     Instrument driver for SR830
     '''
+    # Output numbers for SNAP?
+    _outputs = {'X': 1, 'Y': 2, 'R': 3, 'theta': 4}
+    sample_rate_options = [62.5e-3, 125e-3, 250e-3, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+
     def __init__(self, gpib_address='', name='SR830'):
         self._units = {'amplitude': 'V', 'frequency': 'Hz'}
-        self._visa_handle = visa.ResourceManager().open_resource(gpib_address)
+        self._cache_policy = {'sensitivity': UNTIL_SET, 'time_constant': UNTIL_SET}
+        self._visa_handle = open_resource(gpib_address)
         self._visa_handle.read_termination = '\n'
         self.time_constant_options = {
                 "10 us": 0,
@@ -36,6 +43,8 @@ class SR830(Instrument):
         500e-9, 1e-6, 2e-6, 5e-6, 10e-6, 20e-6, 50e-6, 100e-6,
         200e-6, 500e-6, 1e-3, 2e-3, 5e-3, 10e-3, 20e-3,
         50e-3, 100e-3, 200e-3, 500e-3, 1]
+        self._buffer_channels = {}
+        self._buffer_read = 0
         super(SR830, self).__init__(name)
 
     @property
@@ -91,5 +100,64 @@ class SR830(Instrument):
     def time_constant(self, value):
         self._visa_handle.write('OFLT %s' %self.time_constant_options[value])
     
+    def snap(self, *outputs):
+        '''Read two or more of X, Y, R and theta at the same instant with one SNAP? query.'''
+        values = self._visa_handle.ask('SNAP? %s' %','.join(str(self._outputs[output]) for output in outputs))
+        return dict(zip(outputs, [float(value) for value in values.split(',')]))
+
+    def start_buffer(self, rate=512, ch1='X', ch2='Y'):
+        '''
+        Start filling the internal data buffer with ch1 (X or R) and ch2 (Y or theta) at rate (Hz).
+        The buffer stops when full (16383 points per channel).
+        While the buffer runs, get_datapoint returns the average of the samples taken since the previous datapoint.
+        '''
+        self._visa_handle.write('DDEF 1,%d,0' %{'X': 0, 'R': 1}[ch1])
+        self._visa_handle.write('DDEF 2,%d,0' %{'Y': 0, 'theta': 1}[ch2])
+        self._visa_handle.write('SEND 0')
+        self._visa_handle.write('SRAT %d' %self.sample_rate_options.index(rate))
+        self._visa_handle.write('REST')
+        self._visa_handle.write('STRT')
+        self._buffer_channels = {ch1: 1, ch2: 2}
+        self._buffer_read = 0
+
+    def read_buffer(self):
+        '''Return the samples taken since the last read per channel, fetched with binary TRCB? transfers.'''
+        points = int(self._visa_handle.ask('SPTS?'))
+        new = points - self._buffer_read
+        data = {}
+        for output, channel in self._buffer_channels.items():
+            if new > 0:
+                data[output] = self._visa_handle.query_binary_values('TRCB? %d,%d,%d' %(channel, self._buffer_read, new),
+                    datatype='f', is_big_endian=False, header_fmt='empty', expect_termination=False,
+                    data_points=new, container=numpy.array)
+            else:
+                data[output] = numpy.empty(0)
+        self._buffer_read = points
+        return data
+
+    def stop_buffer(self):
+        '''Pause the data buffer and return to direct readout.'''
+        self._visa_handle.write('PAUS')
+        self._buffer_channels = {}
+
+    def get_datapoint(self, params):
+        '''
+        Read X, Y, R and theta with a single SNAP? query, or from the data buffer while it runs.
+        Other parameters are read one by one.
+        '''
+        outputs = [param for param in params if param in self._outputs]
+        if len(self._buffer_channels) > 0:
+            buffered = [output for output in outputs if output in self._buffer_channels]
+            data = self.read_buffer()
+            values = {output: data[output].mean() if len(data[output]) > 0 else float('nan') for output in buffered}
+        elif len(outputs) > 1:
+            values = self.snap(*outputs)
+        else:
+            values = {}
+        datapoint = super(SR830, self).get_datapoint([param for param in params if param not in values])
+        for output in values:
+            datapoint['%s.%s' %(self._name, output)] = values[output]
+        return datapoint
+
     def __del__(self):
         self._visa_handle.close()
\ No newline at end of file
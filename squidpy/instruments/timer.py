@@ -9,6 +9,7 @@ class Timer(Instrument):
         self._tstart = 0
         self._time = 0
         self._units = {'time': 's'}
+        self._rewrite = ['time']
         super(Timer, self).__init__(name)
         
     @property
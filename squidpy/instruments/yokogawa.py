@@ -1,5 +1,5 @@
 from squidpy.instrument import Instrument
-import visa
+from squidpy.visabus import open_resource
 
 class Yokogawa7651(Instrument):
     '''
@@ -7,7 +7,11 @@ class Yokogawa7651(Instrument):
     '''
     def __init__(self, gpib_address='', name='yokogawa'):
         self._units = {'voltage': 'V'}
-        self._visa_handle = visa.ResourceManager().open_resource(gpib_address)
+        self._tolerance = {'voltage': 1e-9}
+        # Gate voltages are ramped, at 1 V/s in steps of 10 mV
+        self._ramp_rate = {'voltage': 1.}
+        self._ramp_step = {'voltage': 1e-2}
+        self._visa_handle = open_resource(gpib_address)
         self._voltage = 0
         self._output = 0
         super(Yokogawa7651, self).__init__(name)
@@ -0,0 +1,365 @@
+'''
+Measurement plans.
+A measurement list (the {'type': ..., 'params': ...} entries built by Experiment) is compiled once
+into a flat list of nodes, with the setpoints of every sweep computed in advance. The plan is run
+by a loop over the nodes with an explicit stack of loop indices, instead of recursing over copies
+of the measurement list for every point.
+'''
+import re
+import itertools
+from squidpy.utils import get_array, ask_socket
+
+class Node(object):
+    '''
+    One step of a plan: sweep, do_while, do, measure, buffered, adaptive or stream.
+    The loop nodes (sweep, do_while) repeat all nodes that follow them.
+    A sweep with an order runs every other pass backwards, index holds the position of each
+    of its values in the grid as it was given.
+    '''
+    def __init__(self, kind, ins=None, param=None, values=None, params=None, func=None, args=(), clause=None, sweep=None, options=None,
+                 order=None, index=None):
+        self.kind = kind
+        self.ins = ins
+        self.param = param
+        self.values = values
+        self.params = params
+        self.func = func
+        self.args = args
+        self.clause = clause
+        self.sweep = sweep
+        self.options = options
+        self.order = order
+        self.index = index
+        self.call = None
+        self.condition = None
+        self.watch = None
+
+    def __getstate__(self):
+        # Bound callables live in the measurement process only
+        state = dict(self.__dict__)
+        state['call'] = state['condition'] = None
+        return state
+
+    def position(self, iteration, reverse):
+        '''Position in values of the given iteration of a pass.'''
+        return len(self.values) - 1 - iteration if reverse else iteration
+
+    def __repr__(self):
+        if self.kind == 'sweep':
+            return 'sweep %s.%s over %d values%s' %(self.ins, self.param, len(self.values), ', %s' %self.order if self.order else '')
+        elif self.kind == 'buffered':
+            return 'buffered sweep %s.%s over %d values, measure %s' %(self.ins, self.param, len(self.values), self.params)
+        elif self.kind == 'adaptive':
+            return 'adaptive sweep %s from %s values, measure %s' %(', '.join('%s.%s' %(ins, param) for ins, param, values, min_step in self.sweep),
+                                                                   'x'.join(str(len(values)) for ins, param, values, min_step in self.sweep), self.params)
+        elif self.kind == 'stream':
+            return 'stream %d samples of %s from %s.%s%s' %(self.options['samples'], self.params, self.ins, self.func, tuple(self.args))
+        elif self.kind == 'do_while':
+            return 'do while %s' %self.clause
+        elif self.kind == 'do':
+            return 'do %s%s' %(self.func, tuple(self.args))
+        return 'measure %s' %('all' if self.params is None else self.params)
+
+orders = [None, 'serpentine', 'min_travel']
+# Kinds of nodes that take datapoints, the steps a resumed run counts off
+steps = ['measure', 'buffered', 'adaptive', 'stream']
+# Poll settings of do_while conditions, see Measurement.evaluate and Measurement.wait_while
+poll_defaults = {'interval': .1, 'backoff': 1.5, 'max_interval': 2., 'min_interval': 0}
+
+def named_instruments(expression, names):
+    '''Instruments among names that expression refers to, as in 'ppms.temperature > 10'.'''
+    return set(name for name in names if re.search(r'\b%s\.' %re.escape(name), expression))
+
+def latest(sets):
+    '''The last value of every (ins, param) in sets [(ins, param, value)], in the order they were first set.'''
+    values = {}
+    for ins, param, value in sets:
+        values[(ins, param)] = value
+    return [(ins, param, value) for (ins, param), value in values.items()]
+
+def min_travel(values):
+    '''
+    Indices of values in the order of the shortest path through all of them.
+    The values lie on a line, so that is sorted order, starting at the end nearest to the first value.
+    '''
+    index = sorted(range(len(values)), key=lambda i: values[i])
+    if len(index) > 0 and abs(values[index[-1]] - values[0]) < abs(values[index[0]] - values[0]):
+        index.reverse()
+    return index
+
+def sweep_node(ins, param, values, order=None):
+    '''
+    Sweep node over values. With order 'serpentine' every other pass runs backwards, so nested sweeps
+    do not fly back to the start. 'min_travel' also reorders the values to the shortest path.
+    '''
+    if order not in orders:
+        raise ValueError('Unknown sweep order %s' %order)
+    index = min_travel(values) if order == 'min_travel' else list(range(len(values)))
+    return Node('sweep', ins, param, values=[values[i] for i in index], order=order, index=index)
+
+class Plan(object):
+    '''
+    Flat, inspectable execution plan of a measurement list.
+    n_points is the number of datapoints the plan takes (None when a do_while loop decides).
+    While the plan runs, stack holds [node index, iteration] of every active loop.
+    '''
+    def __init__(self, measlist):
+        self.nodes = []
+        self.stack = []
+        for i, meas in enumerate(measlist):
+            kind, params = meas['type'], meas['params']
+            if kind == 'sweep':
+                ins, param, start, stop, step = params[:5]
+                self.nodes.append(sweep_node(ins, param, get_array(start, stop, step), *params[5:]))
+            elif kind == 'sweep_custom':
+                ins, param, arr = params[:3]
+                self.nodes.append(sweep_node(ins, param, arr, *params[3:]))
+            elif kind == 'sweep_buffered':
+                rest = measlist[i+1:]
+                if len(rest)!=1 or rest[0]['type']!='measure':
+                    raise ValueError('A buffered sweep must be followed by a single measure.')
+                ins, param, start, stop, step = params
+                self.nodes.append(Node('buffered', ins, param, values=get_array(start, stop, step),
+                                       params=rest[0]['params'], sweep=(start, stop, step)))
+                break
+            elif kind == 'sweep_adaptive':
+                # One or two adaptive sweeps refine a 1D or 2D grid, see squidpy.adaptive
+                adaptive = list(itertools.takewhile(lambda meas: meas['type'] == 'sweep_adaptive', measlist[i:]))
+                rest = measlist[i+len(adaptive):]
+                if len(adaptive) > 2 or len(rest) != 1 or rest[0]['type'] != 'measure':
+                    raise ValueError('One or two adaptive sweeps must be followed by a single measure.')
+                sweep = [(ins, param, get_array(start, stop, step), options.get('min_step') or abs(step)/16.) for ins, param, start, stop, step, options in
+                         [meas['params'] for meas in adaptive]]
+                self.nodes.append(Node('adaptive', params=rest[0]['params'], sweep=sweep, options=adaptive[0]['params'][5]))
+                break
+            elif kind == 'stream':
+                ins, func, args, samples, columns = params
+                self.nodes.append(Node('stream', ins, func=func, args=args, params=columns, options={'samples': samples}))
+            elif kind == 'do':
+                func, args = params
+                self.nodes.append(Node('do', func=func, args=args))
+            elif kind == 'do_while':
+                clause, options = (params, {}) if isinstance(params, str) else params
+                self.nodes.append(Node('do_while', clause=clause, options=dict(poll_defaults, **options)))
+            elif kind == 'measure':
+                self.nodes.append(Node('measure', params=params))
+            else:
+                raise ValueError('Unknown measurement type %s' %kind)
+
+    def __repr__(self):
+        lines = ['%s%s' %('  '*self._depth(i), node) for i, node in enumerate(self.nodes)]
+        lines.append('%s datapoints' %('unknown number of' if self.n_points is None else self.n_points))
+        return '\n'.join(lines)
+
+    def _depth(self, index):
+        return len([node for node in self.nodes[:index] if node.kind in ['sweep', 'do_while']])
+
+    @property
+    def n_points(self):
+        total = 0
+        repeats = 1
+        for i, node in enumerate(self.nodes):
+            if node.kind == 'do_while':
+                if any(later.kind in steps for later in self.nodes[i+1:]):
+                    return None
+            elif node.kind == 'sweep':
+                repeats *= len(node.values)
+            elif node.kind == 'measure':
+                total += repeats
+            elif node.kind == 'buffered':
+                total += repeats*len(node.values)
+            elif node.kind == 'stream':
+                total += repeats*node.options['samples']
+            elif node.kind == 'adaptive':
+                # An upper bound, the refinement can stop short of the budget
+                if node.options.get('budget') is None:
+                    return None
+                coarse = 1
+                for ins, param, values, min_step in node.sweep:
+                    coarse *= len(values)
+                total += repeats*max(node.options['budget'], coarse)
+        return total
+
+    @property
+    def resumable(self):
+        '''
+        True if the plan takes the same steps every time it runs, so a run can be resumed by skipping
+        the steps it completed. A do_while loop around measurements decides the number of steps.
+        '''
+        for i, node in enumerate(self.nodes):
+            if node.kind == 'do_while' and any(later.kind in steps for later in self.nodes[i+1:]):
+                return False
+        return True
+
+    def check(self, params):
+        '''
+        Check the plan against params, the parameters of every instrument by name (see InstrumentList.all).
+        Raises ValueError if an adaptive sweep observes a column that its datapoints do not have.
+        '''
+        for node in self.nodes:
+            if node.kind == 'adaptive':
+                measured = params if node.params is None else node.params
+                columns = ['%s.%s' %(ins, param) for ins in measured for param in measured[ins]]
+                columns += ['%s.%s' %(ins, param) for ins, param, values, min_step in node.sweep
+                            if param not in measured.get(ins, [])]
+                if node.options['observe'] not in columns:
+                    raise ValueError('The adaptive sweep observes %s, which is not measured. Instruments are named '
+                                     'by their name attribute, the columns are: %s' %(node.options['observe'], ', '.join(columns)))
+
+    def instruments(self, names):
+        '''
+        Instruments among names that the plan writes to and that it reads, as two sets.
+        Sweeps write to their instrument and do steps to the instruments named in their function.
+        Measures read their instruments (all of them if no parameters are given), streams their
+        instrument and do_while steps the instruments named in their condition.
+        '''
+        writes, reads = set(), set()
+        for node in self.nodes:
+            if node.kind in ['sweep', 'buffered']:
+                writes.add(node.ins)
+            elif node.kind == 'adaptive':
+                writes.update(ins for ins, param, values, min_step in node.sweep)
+            if node.kind in ['measure', 'buffered', 'adaptive']:
+                reads.update(names if node.params is None else node.params)
+            elif node.kind == 'stream':
+                reads.add(node.ins)
+            elif node.kind == 'do':
+                writes.update(named_instruments(node.func, names))
+            elif node.kind == 'do_while':
+                reads.update(named_instruments(node.clause, names))
+        return writes, reads
+
+    def bind(self, measurement, namespace):
+        '''
+        Compile do and do_while steps into callables, evaluated in namespace with self = measurement.
+        A do_while condition on a single instrument also gets the expression its daemon can watch.
+        '''
+        local = {'self': measurement}
+        names = [ins._name for ins in measurement.instruments]
+        for node in self.nodes:
+            if node.kind == 'do':
+                if hasattr(measurement.instruments, 's'):
+                    cmd = '%s(*%s)' %(node.func, node.args)
+                    node.call = lambda cmd=cmd: ask_socket(measurement.instruments.s, cmd)
+                else:
+                    func = eval(node.func, namespace, local)
+                    node.call = lambda func=func, args=tuple(node.args): func(*args)
+            elif node.kind == 'do_while':
+                code = compile('self.instruments.' + node.clause, '<do_while>', 'eval')
+                node.condition = lambda code=code: eval(code, namespace, local)
+                named = named_instruments(node.clause, names)
+                if len(named) == 1:
+                    ins = named.pop()
+                    node.watch = (ins, re.sub(r'\b%s\.' %re.escape(ins), '', node.clause))
+
+    def tags(self):
+        '''Grid index of the current value of every running sweep with an order, as datapoint columns.'''
+        tags = {}
+        for pc, iteration, reverse in self.stack:
+            node = self.nodes[pc]
+            if node.kind == 'sweep' and node.order is not None:
+                tags['%s.%s.index' %(node.ins, node.param)] = node.index[node.position(iteration, reverse)]
+        return tags
+
+    def setpoints(self):
+        '''Current value of every running sweep, as datapoint columns.'''
+        setpoints = {}
+        for pc, iteration, reverse in self.stack:
+            node = self.nodes[pc]
+            if node.kind == 'sweep':
+                setpoints['%s.%s' %(node.ins, node.param)] = node.values[node.position(iteration, reverse)]
+        return setpoints
+
+    def _write_before_evaluate(self, measurement, pending):
+        '''Write the pending setpoints, also of a resumed run, as a do_while clause may test them.'''
+        if len(pending) > 0:
+            measurement.write(latest(pending))
+        return []
+
+    def run(self, measurement, skip=0):
+        '''
+        Run the plan with measurement, which provides write(sets), measure(params, sets, tags), do(call),
+        evaluate(node, entering), wait_while(node), buffered_sweep(params, ins, param, start, stop, step, tags),
+        adaptive_sweep(params, sweep, options, tags) and stream(ins, func, args, samples, columns, tags). The tags are added to every datapoint.
+        Streamed samples are also tagged with the values of the running sweeps, as they are not read for every sample.
+        Setpoints are collected on the way into nested sweeps and written together at the next
+        step, so a measure can write them in the same round trip as its readout.
+        Pending setpoints are written before every test of a do_while clause.
+        The first skip measure, buffered, adaptive and stream steps are passed over without writing or doing
+        anything else, to resume an interrupted run. The setpoints of all sweeps are then written at the
+        first step that runs.
+        '''
+        nodes = self.nodes
+        stack = self.stack = []
+        passes = {}
+        pending = []
+        pc = 0
+        while True:
+            if pc == len(nodes):
+                # End of the innermost loop body: next iteration, or leave the loop
+                if skip > 0:
+                    pending = latest(pending)
+                elif len(pending) > 0:
+                    measurement.write(pending)
+                    pending = []
+                while len(stack) > 0:
+                    frame = stack[-1]
+                    frame[1] += 1
+                    node = nodes[frame[0]]
+                    if node.kind == 'sweep' and frame[1] < len(node.values):
+                        pending.append((node.ins, node.param, node.values[node.position(frame[1], frame[2])]))
+                        break
+                    elif node.kind == 'do_while':
+                        pending = self._write_before_evaluate(measurement, pending)
+                        if measurement.evaluate(node):
+                            break
+                    stack.pop()
+                if len(stack) == 0:
+                    break
+                pc = stack[-1][0] + 1
+                continue
+            node = nodes[pc]
+            if node.kind == 'sweep':
+                if len(node.values) == 0:
+                    pc = len(nodes)
+                    continue
+                # Frames are [node index, iteration, backwards]
+                reverse = node.order is not None and passes.get(pc, 0) % 2 == 1
+                passes[pc] = passes.get(pc, 0) + 1
+                stack.append([pc, 0, reverse])
+                pending.append((node.ins, node.param, node.values[node.position(0, reverse)]))
+            elif skip > 0 and node.kind in steps + ['do']:
+                # Completed steps of a resumed run, and the do steps before them
+                if node.kind != 'do':
+                    skip -= 1
+                pending = latest(pending)
+            elif node.kind == 'do_while' and pc == len(nodes) - 1:
+                # Nothing to repeat, only wait for the condition to become false
+                if len(pending) > 0:
+                    measurement.write(pending)
+                    pending = []
+                measurement.wait_while(node)
+            elif node.kind == 'do_while':
+                pending = self._write_before_evaluate(measurement, pending)
+                if not measurement.evaluate(node, entering=True):
+                    pc = len(nodes)
+                    continue
+                stack.append([pc, 0, False])
+            elif node.kind == 'measure':
+                measurement.measure(node.params, pending, self.tags())
+                pending = []
+            else:
+                if len(pending) > 0:
+                    measurement.write(pending)
+                    pending = []
+                if node.kind == 'do':
+                    measurement.do(node.call)
+                elif node.kind == 'buffered':
+                    measurement.buffered_sweep(node.params, node.ins, node.param, *node.sweep, tags=self.tags())
+                elif node.kind == 'adaptive':
+                    measurement.adaptive_sweep(node.params, node.sweep, node.options, self.tags())
+                elif node.kind == 'stream':
+                    tags = self.setpoints()
+                    tags.update(self.tags())
+                    measurement.stream(node.ins, node.func, node.args, node.options['samples'], node.params, tags)
+            pc += 1
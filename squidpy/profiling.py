@@ -0,0 +1,88 @@
+import math
+import threading
+
+class LatencyHistogram(object):
+    '''
+    Histogram of durations in logarithmic buckets: bucket i counts durations below 2**i us.
+    Adding a duration is a few arithmetic operations, cheap enough to leave on for every command.
+    '''
+    n_buckets = 32
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.buckets = [0]*self.n_buckets
+        self.count = 0
+        self.total = 0.
+        self.min = float('inf')
+        self.max = 0.
+
+    def add(self, duration):
+        self.count += 1
+        self.total += duration
+        if duration < self.min:
+            self.min = duration
+        if duration > self.max:
+            self.max = duration
+        index = math.frexp(duration*1e6)[1] if duration > 0 else 0
+        self.buckets[min(max(index, 0), self.n_buckets - 1)] += 1
+
+    def percentile(self, q):
+        '''Upper edge (s) of the bucket holding the q-th percentile.'''
+        if self.count == 0:
+            return None
+        rank = q/100.*self.count
+        cumulative = 0
+        for index, count in enumerate(self.buckets):
+            cumulative += count
+            if cumulative >= rank and count > 0:
+                return min(2**index*1e-6, self.max)
+        return self.max
+
+    def summary(self):
+        '''Count, mean, extremes and percentiles in seconds, and the non-empty buckets keyed by upper edge in us.'''
+        if self.count == 0:
+            return {'count': 0}
+        return {'count': self.count,
+                'mean': self.total/self.count,
+                'min': self.min,
+                'max': self.max,
+                'p50': self.percentile(50),
+                'p90': self.percentile(90),
+                'p99': self.percentile(99),
+                'buckets': {2**index: count for index, count in enumerate(self.buckets) if count > 0}}
+
+class CommandStats(object):
+    '''
+    Timing of the commands served for one instrument, per command, e.g. 'get voltage':
+    queue (from sending the request until the daemon receives it), execute (the driver)
+    and reply (pickling and sending the result). 'read <param>' entries time the driver
+    reads of a parameter, also when they happen inside get_datapoint or a batch.
+    '''
+    stages = ['queue', 'execute', 'reply']
+
+    def __init__(self):
+        self._histograms = {}
+        self._lock = threading.Lock()
+
+    def _get(self, command):
+        if command not in self._histograms:
+            self._histograms[command] = {stage: LatencyHistogram() for stage in self.stages}
+        return self._histograms[command]
+
+    def record(self, command, queue=None, execute=None, reply=None):
+        with self._lock:
+            histograms = self._get(command)
+            for stage, duration in zip(self.stages, [queue, execute, reply]):
+                if duration is not None:
+                    histograms[stage].add(duration)
+
+    def reset(self):
+        with self._lock:
+            self._histograms = {}
+
+    def summary(self):
+        with self._lock:
+            return {command: {stage: histogram.summary() for stage, histogram in histograms.items() if histogram.count > 0}
+                    for command, histograms in self._histograms.items()}
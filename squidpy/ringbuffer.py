@@ -0,0 +1,134 @@
+import time
+import numpy as np
+try:
+    from multiprocessing import shared_memory, resource_tracker
+except ImportError:
+    shared_memory = None
+
+# Header slots: samples written, samples read, samples dropped, producer stalls,
+# stop requested by the consumer, producer finished
+_WRITTEN, _READ, _OVERRUNS, _STALLS, _STOP, _DONE = range(6)
+_HEADER_SIZE = 6
+
+class RingBuffer(object):
+    '''
+    Single-producer, single-consumer ring buffer of samples in shared memory.
+    Samples are rows of width values. The producer writes blocks with write(), the consumer
+    gets NumPy views on the shared memory with peek() and hands them back with release().
+    The buffer can be pickled; the copy in another process attaches to the same memory.
+    When the buffer is full, write() waits for the consumer (back-pressure). Blocks that do
+    not fit before the timeout, or immediately in mode 'drop', are dropped and counted as overruns.
+    '''
+    def __init__(self, capacity=2**16, width=1, dtype='float64', mode='block', name=None):
+        if shared_memory is None:
+            raise ImportError('RingBuffer requires multiprocessing.shared_memory (python 3.8 or newer).')
+        self.capacity = capacity
+        self.width = width
+        self.dtype = np.dtype(dtype)
+        self.mode = mode
+        self._owner = name is None
+        size = _HEADER_SIZE*8 + capacity*width*self.dtype.itemsize
+        self._shm = shared_memory.SharedMemory(name=name, create=self._owner, size=size)
+        if not self._owner:
+            # The creating process is responsible for unlinking the memory
+            try:
+                resource_tracker.unregister(self._shm._name, 'shared_memory')
+            except Exception:
+                pass
+        self.name = self._shm.name
+        self._header = np.ndarray(_HEADER_SIZE, dtype=np.int64, buffer=self._shm.buf)
+        self._data = np.ndarray((capacity, width), dtype=self.dtype, buffer=self._shm.buf, offset=_HEADER_SIZE*8)
+        if self._owner:
+            self._header[:] = 0
+
+    def __getstate__(self):
+        return {'capacity': self.capacity, 'width': self.width, 'dtype': self.dtype.str,
+                'mode': self.mode, 'name': self.name}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+    @property
+    def available(self):
+        '''Number of samples that can be read.'''
+        return int(self._header[_WRITTEN] - self._header[_READ])
+
+    @property
+    def free(self):
+        return self.capacity - self.available
+
+    def write(self, block, timeout=1.):
+        '''Write a block of samples. Returns False if the block was dropped.'''
+        block = np.asarray(block, dtype=self.dtype).reshape(-1, self.width)
+        n = len(block)
+        if n > self.capacity:
+            raise ValueError('Block of %s samples does not fit in buffer of %s.' %(n, self.capacity))
+        if self.free < n:
+            if self.mode == 'block':
+                self._header[_STALLS] += 1
+                deadline = time.monotonic() + timeout
+                while self.free < n and time.monotonic() < deadline and not self.stopped:
+                    time.sleep(0.0005)
+            if self.stopped:
+                return False
+            if self.free < n:
+                self._header[_OVERRUNS] += n
+                return False
+        start = int(self._header[_WRITTEN] % self.capacity)
+        first = min(n, self.capacity - start)
+        self._data[start:start+first] = block[:first]
+        self._data[:n-first] = block[first:]
+        self._header[_WRITTEN] += n
+        return True
+
+    def peek(self, n=None):
+        '''
+        Return views on the oldest n (default all available) samples without copying.
+        The result is a list of one or two arrays, two if the samples wrap around the end.
+        '''
+        available = self.available
+        n = available if n is None else min(n, available)
+        start = int(self._header[_READ] % self.capacity)
+        first = min(n, self.capacity - start)
+        views = [self._data[start:start+first]]
+        if n > first:
+            views.append(self._data[:n-first])
+        return views
+
+    def release(self, n):
+        '''Mark n samples as read so the producer can reuse their space.'''
+        self._header[_READ] += min(n, self.available)
+
+    def read(self, n=None):
+        '''Return a copy of the oldest n (default all available) samples and release them.'''
+        views = self.peek(n)
+        data = np.concatenate(views) if len(views) > 1 else views[0].copy()
+        self.release(len(data))
+        return data
+
+    def stop(self):
+        '''Ask the producer to stop writing.'''
+        self._header[_STOP] = 1
+
+    @property
+    def stopped(self):
+        return bool(self._header[_STOP])
+
+    def finish(self):
+        '''Called by the producer when no more samples will be written.'''
+        self._header[_DONE] = 1
+
+    @property
+    def finished(self):
+        return bool(self._header[_DONE]) and self.available == 0
+
+    def stats(self):
+        return {'written': int(self._header[_WRITTEN]), 'read': int(self._header[_READ]),
+                'overruns': int(self._header[_OVERRUNS]), 'stalls': int(self._header[_STALLS])}
+
+    def close(self):
+        '''Detach from the shared memory, and free it if this buffer created it.'''
+        del self._header, self._data
+        self._shm.close()
+        if self._owner:
+            self._shm.unlink()
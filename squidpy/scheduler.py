@@ -0,0 +1,107 @@
+'''
+Running several experiments at the same time on one pool of instruments, e.g. two samples in one cryostat.
+'''
+import time
+import threading
+from squidpy.instrument import InstrumentList
+
+class ExperimentScheduler(object):
+    '''
+    Runs Experiments concurrently, each in its own Measurement process.
+    Two experiments conflict when one writes to an instrument (sweeps it or names it in a do step)
+    that the other writes to or reads. An experiment starts as soon as it does not conflict with
+    a running experiment, nor with one added before it that is still waiting.
+    Instruments that experiments only read, like the PPMS temperature, are shared.
+    Every experiment only gets the instruments it uses, each on a pipe of its own to the instrument's
+    daemon, which arbitrates between the measurement processes. A terminated experiment holds nothing up,
+    its pipes are dropped by the daemons. The experiments themselves are left as they were.
+
+        scheduler = ExperimentScheduler(sample_a, sample_b)
+        scheduler.run()
+    '''
+    def __init__(self, *experiments, interval=.1):
+        self.interval = interval
+        self.queued = []
+        self.running = []
+        self.finished = []
+        self._usage = {}
+        self._instruments = {}
+        self._thread = None
+        for experiment in experiments:
+            self.add(experiment)
+
+    def add(self, experiment):
+        '''Queue experiment, it is started by run() or by the running scheduler.'''
+        names = [ins._name for ins in experiment.instruments]
+        writes, reads = experiment.plan.instruments(names)
+        self._usage[experiment] = (writes, reads)
+        self._instruments[experiment] = InstrumentList(*[ins.attach() for ins in experiment.instruments if ins._name in writes | reads])
+        self.queued.append(experiment)
+
+    def conflict(self, a, b):
+        '''True if experiments a and b cannot run at the same time.'''
+        writes_a, reads_a = self._usage[a]
+        writes_b, reads_b = self._usage[b]
+        return len(writes_a & (writes_b | reads_b)) > 0 or len(writes_b & reads_a) > 0
+
+    def _start(self, experiment):
+        instruments, experiment.instruments = experiment.instruments, self._instruments[experiment]
+        try:
+            if experiment.measurement.pid is None:
+                experiment.measurement.use_instruments(experiment.instruments)
+            experiment.run()
+        finally:
+            experiment.instruments = instruments
+        self.running.append(experiment)
+
+    def _finish(self, experiment):
+        self.running.remove(experiment)
+        self.finished.append(experiment)
+        # The daemons drop the pipes once the measurement process has closed its ends as well
+        for ins in self._instruments.pop(experiment):
+            if ins._pipe is not None:
+                ins._pipe.close()
+
+    def dispatch(self):
+        '''Collect the experiments that finished and start the queued ones that can run.'''
+        for experiment in list(self.running):
+            if experiment.measurement.exitcode is not None:
+                self._finish(experiment)
+        waiting = []
+        for experiment in list(self.queued):
+            if any(self.conflict(experiment, other) for other in self.running + waiting):
+                waiting.append(experiment)
+            else:
+                self.queued.remove(experiment)
+                self._start(experiment)
+
+    def _loop(self):
+        while len(self.queued) + len(self.running) > 0:
+            self.dispatch()
+            time.sleep(self.interval)
+
+    def start(self):
+        '''Dispatch experiments from a background thread until all have finished.'''
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._loop)
+            self._thread.daemon = True
+            self._thread.start()
+
+    def wait(self, timeout=None):
+        '''Wait for all experiments to finish, returns False on timeout.'''
+        if self._thread is not None:
+            self._thread.join(timeout)
+            return not self._thread.is_alive()
+        return True
+
+    def run(self):
+        '''Run all experiments and return when they have finished.'''
+        self.start()
+        self.wait()
+
+    def status(self):
+        '''State of every experiment by title: queued, running or finished.'''
+        status = {}
+        for state in ['queued', 'running', 'finished']:
+            status.update({experiment.title: state for experiment in getattr(self, state)})
+        return status
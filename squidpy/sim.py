@@ -0,0 +1,775 @@
+'''
+Simulated instruments, for running the real drivers without hardware.
+
+VISA drivers: use a 'SIM::<model>' address, with options appended as ::key=value, e.g.
+    instrument('Keithley2400', 'SIM::Keithley2400::latency=0.002::resistance=1e3')
+The VisaBus opens these addresses with open_resource() below instead of a VISA resource manager.
+
+Socket drivers: start a simulated server and connect the driver to it, e.g.
+    server = SimPPMS(temperature=300).start()
+    instrument('PPMS', 'localhost', server.port)
+
+Simulated instruments in one process that name the same sample (::sample=dut) measure the same
+device: the current of a Keithley6220 shows up as voltage on a Keithley2182A. Instruments in
+separate InstrumentDaemon processes each get their own sample; use an InstrumentHost to couple them.
+'''
+import re
+import time
+import math
+import random
+import threading
+import socketserver
+import ast
+from collections import deque
+
+class Sample(object):
+    '''
+    Device under test with the IV curve of an overdamped Josephson junction:
+    V = R*sqrt(I^2 - Ic^2) above the critical current Ic and 0 below it (Ic = 0 is a resistor).
+    '''
+    def __init__(self, resistance=1e3, critical_current=0.):
+        self.resistance = resistance
+        self.critical_current = critical_current
+        self.current = 0.
+        # Currents at which a source sent a trigger, consumed by triggered voltmeters
+        self.triggers = []
+
+    def voltage(self, current):
+        if abs(current) <= self.critical_current:
+            return 0.
+        return math.copysign(self.resistance*math.sqrt(current**2 - self.critical_current**2), current)
+
+    def current_at(self, voltage):
+        if voltage == 0:
+            return 0.
+        return math.copysign(math.sqrt((voltage/self.resistance)**2 + self.critical_current**2), voltage)
+
+_samples = {}
+_lock = threading.Lock()
+
+def get_sample(name=None, **kwargs):
+    '''The sample called name, created with kwargs on first use. Without a name a new sample is returned.'''
+    if name is None:
+        return Sample(**kwargs)
+    with _lock:
+        if name not in _samples:
+            _samples[name] = Sample(**kwargs)
+        return _samples[name]
+
+class Ramp(object):
+    '''Value that moves linearly towards its setpoint at rate (per second).'''
+    def __init__(self, value, rate):
+        self._start = value
+        self._t0 = time.monotonic()
+        self.setpoint = value
+        self.rate = rate
+
+    def _travelled(self):
+        return self.rate*(time.monotonic() - self._t0)
+
+    @property
+    def value(self):
+        distance = self.setpoint - self._start
+        travelled = self._travelled()
+        # The setpoint itself once reached, start + distance is not always exactly the setpoint
+        if travelled >= abs(distance):
+            return self.setpoint
+        return self._start + math.copysign(travelled, distance)
+
+    def set(self, setpoint, rate=None):
+        self._start = self.value
+        self._t0 = time.monotonic()
+        self.setpoint = setpoint
+        if rate is not None:
+            self.rate = rate
+
+    @property
+    def stable(self):
+        return self._travelled() >= abs(self.setpoint - self._start)
+
+class SimResource(object):
+    '''
+    pyvisa-like resource that answers SCPI commands from a model.
+    Every command takes latency seconds plus gaussian jitter; latencies overrides the latency per
+    command (keyed by the command without arguments, e.g. ':READ?'). Binary blocks take
+    4 bytes per value at transfer_rate bytes/s. Readings get gaussian noise with std noise.
+    Subclasses list (pattern, method) pairs in _commands; the method gets the groups of the
+    matching pattern and returns the reply, or None for commands without one.
+    '''
+    _commands = []
+
+    def __init__(self, latency=1e-3, jitter=0., transfer_rate=1e6, noise=0., seed=None, latencies=None):
+        self.timeout = 2000
+        self.read_termination = '\n'
+        self.write_termination = '\n'
+        self.latency = latency
+        self.jitter = jitter
+        self.transfer_rate = transfer_rate
+        self.noise = noise
+        self.latencies = latencies or {}
+        self._random = random.Random(seed)
+        self._replies = deque()
+        self._patterns = [(re.compile(pattern, re.IGNORECASE), method) for pattern, method in self._commands]
+
+    def _wait(self, cmd):
+        header = cmd.split(' ')[0]
+        delay = self.latencies.get(header, self.latency)
+        if self.jitter > 0:
+            delay += self._random.gauss(0, self.jitter)
+        if delay > 0:
+            time.sleep(delay)
+
+    def _noisy(self, value, scale=1.):
+        if self.noise == 0:
+            return value
+        return value + self._random.gauss(0, self.noise*scale)
+
+    def _handle(self, cmd):
+        for pattern, method in self._patterns:
+            match = pattern.fullmatch(cmd)
+            if match:
+                return getattr(self, method)(*match.groups())
+        raise ValueError('%s: unknown command %r' %(type(self).__name__, cmd))
+
+    def _none(self, *args):
+        return None
+
+    def write(self, message, termination=None, encoding=None):
+        message = message.strip()
+        self._wait(message)
+        reply = self._handle(message)
+        if reply is not None:
+            self._replies.append(reply)
+        return len(message)
+
+    def read(self, termination=None, encoding=None):
+        if len(self._replies) == 0:
+            raise IOError('VI_ERROR_TMO (%s): no reply to read' %type(self).__name__)
+        return self._replies.popleft()
+
+    def query(self, message, delay=None):
+        self.write(message)
+        return self.read()
+
+    ask = query
+
+    def read_raw(self, size=None):
+        return ('%s\n' %self.read()).encode()
+
+    def write_raw(self, message):
+        return self.write(message.decode())
+
+    def query_ascii_values(self, message, converter='f', separator=',', container=list, delay=None):
+        return container([float(value) for value in self.query(message).split(separator)])
+
+    def query_binary_values(self, message, datatype='f', is_big_endian=False, container=list, delay=None, **kwargs):
+        self.write(message)
+        values = self.read()
+        if self.transfer_rate > 0:
+            time.sleep(4*len(values)/self.transfer_rate)
+        return container(values)
+
+    def clear(self):
+        self._replies.clear()
+
+    def close(self):
+        pass
+
+class SimKeithley2400(SimResource):
+    '''
+    Keithley 2400 sourcing voltage or current into a Sample. Every reading takes nplc power line
+    cycles; sweeps (:SOUR:xxx:MODE SWE with :TRIG:COUN) are returned as one block.
+    '''
+    _commands = [
+        (r':?SOUR:FUNC(?::MODE)? (VOLT|CURR|MEM)', '_set_func'),
+        (r':?SOUR:FUNC(?::MODE)?\?', '_get_func'),
+        (r':?SOUR:(VOLT|CURR)(?::LEV)?(?::AMPL)? ([^?]+)', '_set_level'),
+        (r':?SOUR:(VOLT|CURR)(?::LEV)?(?::AMPL)?\?', '_get_level'),
+        (r':?SOUR:(VOLT|CURR):(STAR|STOP) (\S+)', '_set_limit'),
+        (r':?SOUR:(VOLT|CURR):MODE (FIX|SWE)', '_set_mode'),
+        (r':?SOUR:SWE:POIN (\d+)', '_set_points'),
+        (r':?SOUR:DEL (\S+)', '_set_delay'),
+        (r':?SENS:\w+:NPLC (\S+)', '_set_nplc'),
+        (r':?TRIG:COUN (\d+)', '_set_trigger_count'),
+        (r':?FORM:DATA (ASC|SRE|REAL,32)', '_set_format'),
+        (r':?FORM:ELEM (\S+)', '_set_elements'),
+        (r':?FORM:ELEM\?', '_get_elements'),
+        (r':?FORM:BORD .+', '_none'),
+        (r':?OUTP (ON|OFF|1|0)', '_set_output'),
+        (r':?OUTP\?', '_get_output'),
+        (r':?READ\?', '_read'),
+        (r'\*RST', '_reset'),
+        (r'\*OPC\?', '_opc'),
+    ]
+
+    def __init__(self, sample=None, resistance=1e3, critical_current=0., line_frequency=60, noise=1e-9, **kwargs):
+        super(SimKeithley2400, self).__init__(noise=noise, **kwargs)
+        self.sample = get_sample(sample, resistance=resistance, critical_current=critical_current)
+        self.line_frequency = line_frequency
+        self._reset()
+
+    def _reset(self):
+        self._func = 'VOLT'
+        self._level = {'VOLT': 0., 'CURR': 0.}
+        self._limits = {'VOLT': {'STAR': 0., 'STOP': 0.}, 'CURR': {'STAR': 0., 'STOP': 0.}}
+        self._mode = {'VOLT': 'FIX', 'CURR': 'FIX'}
+        self._points = 1
+        self._delay = 0.
+        self._nplc = 1.
+        self._trigger_count = 1
+        self._binary = False
+        self._elements = 'VOLT,CURR,RES,TIME,STAT'
+        self._output = 0
+
+    def _set_func(self, func):
+        self._func = func.upper()
+
+    def _get_func(self):
+        return self._func
+
+    def _set_level(self, func, value):
+        self._level[func.upper()] = float(value)
+
+    def _get_level(self, func):
+        return repr(self._level[func.upper()])
+
+    def _set_limit(self, func, limit, value):
+        self._limits[func.upper()][limit.upper()] = float(value)
+
+    def _set_mode(self, func, mode):
+        self._mode[func.upper()] = mode.upper()
+
+    def _set_points(self, points):
+        self._points = int(points)
+
+    def _set_delay(self, delay):
+        self._delay = float(delay)
+
+    def _set_nplc(self, nplc):
+        self._nplc = float(nplc)
+
+    def _set_trigger_count(self, count):
+        self._trigger_count = int(count)
+
+    def _set_format(self, fmt):
+        self._binary = fmt.upper() != 'ASC'
+
+    def _set_elements(self, elements):
+        self._elements = elements.upper()
+
+    def _get_elements(self):
+        return self._elements
+
+    def _set_output(self, status):
+        self._output = int(status.upper() in ['ON', '1'])
+
+    def _get_output(self):
+        return str(self._output)
+
+    def _opc(self):
+        return '1'
+
+    def _measure(self, level):
+        if self._func == 'CURR':
+            current = level
+            voltage = self._noisy(self.sample.voltage(current))
+        else:
+            voltage = level
+            current = self._noisy(self.sample.current_at(voltage))
+        self.sample.current = current
+        return voltage, current
+
+    def _read(self):
+        # :READ? turns the output on, like the real instrument
+        self._output = 1
+        if self._mode[self._func] == 'SWE':
+            start, stop = self._limits[self._func]['STAR'], self._limits[self._func]['STOP']
+            step = (stop - start)/(self._points - 1) if self._points > 1 else 0.
+            setpoints = [start + i*step for i in range(self._points)][:self._trigger_count]
+        else:
+            setpoints = [self._level[self._func]]*self._trigger_count
+        time.sleep(len(setpoints)*(self._delay + self._nplc/self.line_frequency))
+        data = []
+        for setpoint in setpoints:
+            data.extend(self._measure(setpoint))
+        if self._binary:
+            return data
+        return ','.join('%e' %value for value in data)
+
+class SimKeithley6220(SimResource):
+    '''
+    Keithley 6220 current source driving a Sample. Sweeps send a trigger per step to the Sample,
+    where a Keithley2182A armed with an external trigger picks them up. *OPC? waits for the sweep.
+    '''
+    _commands = [
+        (r'SOUR:CURR (\S+)', '_set_current'),
+        (r'SOUR:CURR\?', '_get_current'),
+        (r'SOUR:CURR:COMP (\S+)', '_set_compliance'),
+        (r'SOUR:CURR:COMP\?', '_get_compliance'),
+        (r'SOUR:CURR:(STAR|STOP|STEP) (\S+)', '_set_sweep'),
+        (r'SOUR:DEL (\S+)', '_set_delay'),
+        (r'SOUR:SWE:(?:SPAC|COUN|CAB) \S+', '_none'),
+        (r'TRIG:OUTP (\S+)', '_set_trigger_output'),
+        (r'SOUR:SWE:ARM', '_none'),
+        (r'INIT', '_init'),
+        (r'OUTP (ON|OFF|1|0)', '_set_output'),
+        (r'OUTP\?', '_get_output'),
+        (r'CLE', '_clear'),
+        (r'\*RST', '_reset'),
+        (r'\*OPC\?', '_opc'),
+    ]
+
+    def __init__(self, sample=None, resistance=1e3, critical_current=0., **kwargs):
+        super(SimKeithley6220, self).__init__(**kwargs)
+        self.sample = get_sample(sample, resistance=resistance, critical_current=critical_current)
+        self._reset()
+
+    def _reset(self):
+        self._current = 0.
+        self._compliance = 0.1
+        self._output = 0
+        self._sweep = {'STAR': 0., 'STOP': 0., 'STEP': 0.}
+        self._delay = 1e-3
+        self._trigger_output = 'OFF'
+        self._done = 0.
+        self._update()
+
+    def _update(self):
+        self.sample.current = self._current if self._output else 0.
+
+    def _set_current(self, value):
+        self._current = float(value)
+        self._update()
+
+    def _get_current(self):
+        return repr(self._current)
+
+    def _set_compliance(self, value):
+        self._compliance = float(value)
+
+    def _get_compliance(self):
+        return repr(self._compliance)
+
+    def _set_sweep(self, key, value):
+        self._sweep[key.upper()] = float(value)
+
+    def _set_delay(self, delay):
+        self._delay = float(delay)
+
+    def _set_trigger_output(self, value):
+        self._trigger_output = value.upper()
+
+    def _set_output(self, status):
+        self._output = int(status.upper() in ['ON', '1'])
+        self._update()
+
+    def _get_output(self):
+        return str(self._output)
+
+    def _clear(self):
+        self._output = 0
+        self._update()
+
+    def _init(self):
+        start, stop, step = self._sweep['STAR'], self._sweep['STOP'], self._sweep['STEP']
+        points = int(round(abs((stop - start)/step))) + 1 if step != 0 else 1
+        step = math.copysign(step, stop - start)
+        setpoints = [start + i*step for i in range(points)]
+        if self._trigger_output != 'OFF':
+            self.sample.triggers.extend(setpoints)
+        self._output = 1
+        self._current = setpoints[-1]
+        self._update()
+        self._done = time.monotonic() + points*self._delay
+
+    def _opc(self):
+        remaining = self._done - time.monotonic()
+        if remaining > 0:
+            time.sleep(remaining)
+        return '1'
+
+class SimKeithley2182A(SimResource):
+    '''
+    Keithley 2182A measuring the voltage over a Sample. A reading takes nplc power line cycles and
+    its noise scales as 1/sqrt(nplc). With an external trigger (:TRIG:SOUR EXT, :INIT) the buffer
+    takes one reading per trigger the Sample received since.
+    '''
+    _ranges = [0.01, 0.1, 1., 10., 100.]
+    _commands = [
+        (r':?CONF:VOLT(?::DC)?', '_none'),
+        (r'\*RST', '_reset'),
+        (r':?READ\?', '_read'),
+        (r':?SENS:VOLT(?::DC)?:NPLC (\S+)', '_set_nplc'),
+        (r':?SENS:VOLT(?::DC)?:NPLC\?', '_get_nplc'),
+        (r':?SENS:VOLT(?::DC)?:RANG (\S+)', '_set_range'),
+        (r':?SENS:VOLT(?::DC)?:RANG\?', '_get_range'),
+        (r':?SENS:VOLT(?::DC)?:RANG:AUTO (ON|OFF|1|0)', '_set_autorange'),
+        (r':?SENS:VOLT(?::DC)?:RANG:AUTO\?', '_get_autorange'),
+        (r':?TRAC:CLE', '_clear_trace'),
+        (r':?TRAC:POIN (\d+)', '_set_trace_points'),
+        (r':?TRAC:FEED(?::CONT)? \S+', '_none'),
+        (r':?TRIG:SOUR (IMM|EXT)', '_set_trigger_source'),
+        (r':?TRIG:COUN (\d+)', '_none'),
+        (r':?INIT', '_init'),
+        (r':?FORM:DATA (ASC|SRE|REAL,32)', '_set_format'),
+        (r':?FORM:BORD \S+', '_none'),
+        (r':?TRAC:DATA\?', '_trace_data'),
+    ]
+
+    def __init__(self, sample=None, resistance=1e3, critical_current=0., line_frequency=60, noise=1e-8, **kwargs):
+        super(SimKeithley2182A, self).__init__(noise=noise, **kwargs)
+        self.sample = get_sample(sample, resistance=resistance, critical_current=critical_current)
+        self.line_frequency = line_frequency
+        self._reset()
+
+    def _reset(self):
+        self._nplc = 5.
+        self._range = 0.1
+        self._autorange = 1
+        self._trace_points = 1024
+        self._trigger_source = 'IMM'
+        self._trigger_start = len(self.sample.triggers)
+        self._binary = False
+
+    def _reading(self, current):
+        voltage = self._noisy(self.sample.voltage(current), 1/math.sqrt(self._nplc))
+        if self._autorange:
+            self._range = next((r for r in self._ranges if abs(voltage) <= r), self._ranges[-1])
+        return voltage
+
+    def _read(self):
+        time.sleep(self._nplc/self.line_frequency)
+        return '%e' %self._reading(self.sample.current)
+
+    def _set_nplc(self, nplc):
+        self._nplc = float(nplc)
+
+    def _get_nplc(self):
+        return repr(self._nplc)
+
+    def _set_range(self, value):
+        self._range = float(value)
+        self._autorange = 0
+
+    def _get_range(self):
+        return repr(self._range)
+
+    def _set_autorange(self, status):
+        self._autorange = int(status.upper() in ['ON', '1'])
+
+    def _get_autorange(self):
+        return str(self._autorange)
+
+    def _clear_trace(self):
+        self._trigger_start = len(self.sample.triggers)
+
+    def _set_trace_points(self, points):
+        self._trace_points = int(points)
+
+    def _set_trigger_source(self, source):
+        self._trigger_source = source.upper()
+
+    def _init(self):
+        self._trigger_start = len(self.sample.triggers)
+
+    def _set_format(self, fmt):
+        self._binary = fmt.upper() != 'ASC'
+
+    def _trace_data(self):
+        currents = self.sample.triggers[self._trigger_start:self._trigger_start + self._trace_points]
+        time.sleep(len(currents)*self._nplc/self.line_frequency)
+        data = [self._reading(current) for current in currents]
+        if self._binary:
+            return data
+        return ','.join('%e' %value for value in data)
+
+class SimSR830(SimResource):
+    '''
+    SR830 lock-in measuring a first order low-pass filter with gain and cutoff frequency (Hz)
+    driven by its sine output. Noise is given for a 100 ms time constant and scales as 1/sqrt(tau).
+    The data buffer fills at the sample rate from STRT and holds buffer_size points per channel.
+    '''
+    _time_constants = [10e-6, 30e-6, 100e-6, 300e-6, 1e-3, 3e-3, 10e-3, 30e-3, 100e-3, 300e-3,
+                       1., 3., 10., 30., 100., 300., 1e3, 3e3, 10e3, 30e3]
+    _sample_rates = [62.5e-3, 125e-3, 250e-3, 0.5, 1, 2, 4, 8, 16, 32, 64, 128, 256, 512]
+    _commands = [
+        (r'SENS\?', '_get_sensitivity'),
+        (r'SENS ?(\d+)', '_set_sensitivity'),
+        (r'SLVL\?', '_get_amplitude'),
+        (r'SLVL (\S+)', '_set_amplitude'),
+        (r'FREQ\?', '_get_frequency'),
+        (r'FREQ (\S+)', '_set_frequency'),
+        (r'OFLT\?', '_get_time_constant'),
+        (r'OFLT (\d+)', '_set_time_constant'),
+        (r'OUTP\? ?(\d)', '_output'),
+        (r'SNAP\? ?([\d,]+)', '_snap'),
+        (r'DDEF (\d),(\d),\d', '_set_display'),
+        (r'SEND \d', '_none'),
+        (r'SRAT (\d+)', '_set_sample_rate'),
+        (r'REST', '_reset_buffer'),
+        (r'STRT', '_start_buffer'),
+        (r'PAUS', '_pause_buffer'),
+        (r'SPTS\?', '_buffer_points'),
+        (r'TRCB\? ?(\d),(\d+),(\d+)', '_buffer_data'),
+        (r'\*RST', '_reset'),
+    ]
+
+    def __init__(self, gain=1e-3, cutoff=1e4, buffer_size=16383, noise=1e-7, **kwargs):
+        super(SimSR830, self).__init__(noise=noise, **kwargs)
+        self.gain = gain
+        self.cutoff = cutoff
+        self.buffer_size = int(buffer_size)
+        self._reset()
+
+    def _reset(self):
+        self._sensitivity = 26
+        self._amplitude = 0.004
+        self._frequency = 1000.
+        self._time_constant = 8
+        self._display = {1: 0, 2: 0}
+        self._sample_rate = 13
+        self._reset_buffer()
+
+    def _outputs(self):
+        '''X, Y, R and theta (degrees) of the current signal with noise.'''
+        h = self.gain/complex(1, self._frequency/self.cutoff)
+        scale = math.sqrt(0.1/self._time_constants[self._time_constant])
+        x = self._noisy(self._amplitude*h.real, scale)
+        y = self._noisy(self._amplitude*h.imag, scale)
+        return {1: x, 2: y, 3: math.hypot(x, y), 4: math.degrees(math.atan2(y, x))}
+
+    def _get_sensitivity(self):
+        return str(self._sensitivity)
+
+    def _set_sensitivity(self, index):
+        self._sensitivity = int(index)
+
+    def _get_amplitude(self):
+        return repr(self._amplitude)
+
+    def _set_amplitude(self, value):
+        self._amplitude = float(value)
+
+    def _get_frequency(self):
+        return repr(self._frequency)
+
+    def _set_frequency(self, value):
+        self._frequency = float(value)
+
+    def _get_time_constant(self):
+        return str(self._time_constant)
+
+    def _set_time_constant(self, index):
+        self._time_constant = int(index)
+
+    def _output(self, index):
+        return '%e' %self._outputs()[int(index)]
+
+    def _snap(self, indices):
+        outputs = self._outputs()
+        return ','.join('%e' %outputs[int(index)] for index in indices.split(','))
+
+    def _set_display(self, channel, display):
+        self._display[int(channel)] = int(display)
+
+    def _set_sample_rate(self, index):
+        self._sample_rate = int(index)
+
+    def _reset_buffer(self):
+        self._buffer = {1: [], 2: []}
+        self._started = None
+        self._points = 0
+
+    def _start_buffer(self):
+        if self._started is None:
+            self._started = time.monotonic()
+
+    def _pause_buffer(self):
+        self._points = self._buffer_points_now()
+        self._started = None
+
+    def _buffer_points_now(self):
+        points = self._points
+        if self._started is not None:
+            points += int((time.monotonic() - self._started)*self._sample_rates[self._sample_rate])
+        return min(points, self.buffer_size)
+
+    def _buffer_points(self):
+        return str(self._buffer_points_now())
+
+    def _buffer_data(self, channel, start, points):
+        total = self._buffer_points_now()
+        while len(self._buffer[1]) < total:
+            outputs = self._outputs()
+            # channel 1 shows X or R, channel 2 Y or theta
+            self._buffer[1].append(outputs[1 + 2*self._display[1]])
+            self._buffer[2].append(outputs[2 + 2*self._display[2]])
+        start, points = int(start), int(points)
+        if start + points > total:
+            raise ValueError('SimSR830: TRCB? beyond the %d points in the buffer' %total)
+        return self._buffer[int(channel)][start:start + points]
+
+_models = {
+    'Keithley2400': SimKeithley2400,
+    'Keithley6220': SimKeithley6220,
+    'Keithley2182A': SimKeithley2182A,
+    'SR830': SimSR830,
+}
+
+def _parse_value(value):
+    try:
+        return float(value)
+    except ValueError:
+        return value
+
+def is_simulated(address):
+    return address.upper().startswith('SIM::')
+
+def open_resource(address):
+    '''Create the simulated resource for an address SIM::<model>[::key=value...].'''
+    fields = address.split('::')
+    if len(fields) < 2 or fields[1] not in _models:
+        raise ValueError('Unknown simulated instrument %s, choose from %s' %(address, ', '.join(sorted(_models))))
+    kwargs = {}
+    for field in fields[2:]:
+        key, value = field.split('=', 1)
+        kwargs[key] = _parse_value(value)
+    if 'seed' in kwargs:
+        kwargs['seed'] = int(kwargs['seed'])
+    return _models[fields[1]](**kwargs)
+
+class _Handler(socketserver.BaseRequestHandler):
+    def handle(self):
+        while True:
+            data = self.request.recv(1024)
+            if not data:
+                break
+            self.request.sendall(self.server.sim.reply(data.decode()).encode())
+
+class SimServer(object):
+    '''
+    TCP server for a simulated socket instrument, served by a daemon thread.
+    Each reply is delayed by latency seconds plus gaussian jitter.
+    '''
+    def __init__(self, host='localhost', port=0, latency=1e-3, jitter=0., noise=0., seed=None):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.jitter = jitter
+        self.noise = noise
+        self._random = random.Random(seed)
+        self._server = None
+
+    def start(self):
+        '''Start serving and return self; the port is available as self.port.'''
+        socketserver.ThreadingTCPServer.allow_reuse_address = True
+        self._server = socketserver.ThreadingTCPServer((self.host, self.port), _Handler)
+        self._server.daemon_threads = True
+        self._server.sim = self
+        self.port = self._server.server_address[1]
+        thread = threading.Thread(target=self._server.serve_forever, name=type(self).__name__)
+        thread.daemon = True
+        thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reply(self, message):
+        delay = self.latency + (self._random.gauss(0, self.jitter) if self.jitter > 0 else 0)
+        if delay > 0:
+            time.sleep(delay)
+        return self.handle(message)
+
+    def handle(self, message):
+        raise NotImplementedError
+
+    def _noisy(self, value):
+        if self.noise == 0:
+            return value
+        return value + self._random.gauss(0, self.noise)
+
+class SimPPMS(SimServer):
+    '''
+    PyQDInstrument server of a PPMS, for the PPMS driver. Temperature and field ramp linearly to
+    their setpoints at temperature_rate (K/min) and field_rate (Oe/min).
+    '''
+    def __init__(self, temperature=300., field=0., temperature_rate=10., field_rate=100., **kwargs):
+        super(SimPPMS, self).__init__(**kwargs)
+        self._temperature = Ramp(temperature, temperature_rate/60.)
+        self._field = Ramp(field, field_rate/60.)
+        self._settings = {'temperature_approach': 'FastSettle', 'field_approach': 'Linear',
+                          'field_mode': 'Persistent', 'chamber': 'PurgedAndSealed'}
+
+    def get(self, param):
+        if param == 'temperature':
+            return self._noisy(self._temperature.value)
+        elif param == 'field':
+            return self._field.value
+        elif param in ['temperature_rate', 'field_rate']:
+            return getattr(self, '_' + param[:-5]).rate*60
+        elif param == 'temperature_status':
+            return 'Stable' if self._temperature.stable else 'Tracking'
+        elif param == 'field_status':
+            return 'Holding' if self._field.stable else 'Charging'
+        return self._settings[param]
+
+    def set(self, param, value):
+        if param in ['temperature', 'field']:
+            getattr(self, '_' + param).set(value)
+        elif param in ['temperature_rate', 'field_rate']:
+            getattr(self, '_' + param[:-5]).set(getattr(self, '_' + param[:-5]).setpoint, value/60.)
+        else:
+            self._settings[param] = value
+
+    def handle(self, message):
+        if '=' in message:
+            param, value = [part.strip() for part in message.split('=', 1)]
+            self.set(param, ast.literal_eval(value))
+            return 'None'
+        return repr(self.get(message.strip()))
+
+class SimMontana(SimServer):
+    '''
+    Montana Cryostation server, for the MontanaCryostation driver. Messages and replies start with
+    their length in two digits. The platform cools down (SCD) to the setpoint and warms up (SWU)
+    to room temperature at rate (K/min).
+    '''
+    def __init__(self, temperature=295., setpoint=3.2, rate=5., base_pressure=1e-4, **kwargs):
+        super(SimMontana, self).__init__(**kwargs)
+        self._temperature = Ramp(temperature, rate/60.)
+        self._setpoint = setpoint
+        self._cooling = False
+        self.base_pressure = base_pressure
+
+    def handle(self, message):
+        cmd = message[2:]
+        if cmd == 'GPT':
+            value = '%.3f' %self._noisy(self._temperature.value)
+        elif cmd == 'GPS':
+            value = '%.4f' %abs(self._noisy(self._temperature.value - self._temperature.setpoint))
+        elif cmd == 'GTSP':
+            value = '%.3f' %self._setpoint
+        elif cmd.startswith('STSP'):
+            self._setpoint = float(cmd[4:])
+            if self._cooling:
+                self._temperature.set(self._setpoint)
+            value = 'OK'
+        elif cmd == 'GCP':
+            value = '%.3e' %(self.base_pressure*math.exp(self._temperature.value/30.))
+        elif cmd == 'SCD':
+            self._cooling = True
+            self._temperature.set(self._setpoint)
+            value = 'OK'
+        elif cmd == 'SWU':
+            self._cooling = False
+            self._temperature.set(295.)
+            value = 'OK'
+        elif cmd == 'STP':
+            self._cooling = False
+            self._temperature.set(self._temperature.value)
+            value = 'OK'
+        else:
+            value = 'Error: unknown command %s' %cmd
+        return '%02d%s' %(len(value), value)
@@ -3,4 +3,8 @@ from .data import *
 from .experiment import *
 from .instrument import *
 from .utils import *
-from .server import *
\ No newline at end of file
+from .cache import *
+from .ringbuffer import *
+from .server import *
+from .sim import *
+from .scheduler import *
@@ -0,0 +1,137 @@
+'''
+Batched datapoint transport from a Measurement to its DataCollector.
+Instead of one pickled dict per point, the columns are sent once as a schema and the values of
+many points follow as one array per column:
+    ('schema', columns)   column names of the batches that follow, sorted
+    ('batch', values)     one array (or list) of values per column
+    ('checkpoint', dict)  position of the run in its plan, sent after the batch with its last point
+Other messages, such as ('metadata', dict) and the closing None, pass through in order.
+'''
+import time
+import threading
+from array import array
+
+def pack(values):
+    '''Pack a column of values into an array if they are all floats or all integers, else keep the list.'''
+    if hasattr(values, 'dtype'):
+        # numpy arrays, e.g. blocks of streamed samples, are packed without going through their values
+        typecode = {'f': 'd', 'i': 'q', 'u': 'q'}.get(values.dtype.kind)
+        if typecode is None:
+            return list(values)
+        packed = array(typecode)
+        packed.frombytes(values.astype({'d': 'float64', 'q': 'int64'}[typecode]).tobytes())
+        return packed
+    if all(isinstance(value, float) for value in values):
+        return array('d', values)
+    if all(isinstance(value, int) and not isinstance(value, bool) for value in values):
+        try:
+            return array('q', values)
+        except OverflowError:
+            pass
+    return values
+
+def unpack(values):
+    '''Column as a numpy array, without copying packed arrays.'''
+    import numpy as np
+    if isinstance(values, array):
+        return np.frombuffer(values, {'d': 'float64', 'q': 'int64'}[values.typecode])
+    return np.array(values, dtype=object)
+
+class BatchSender(object):
+    '''
+    Collects datapoints and sends them through pipe in batches, when size points have been collected
+    or interval seconds after the first point of the batch, whichever comes first.
+    A background thread takes care of the interval, so slow measurements are not held back.
+    '''
+    def __init__(self, pipe, size=1000, interval=.1):
+        self.pipe = pipe
+        self.size = size
+        self.interval = interval
+        self.columns = None
+        self.batches = 0
+        self._values = None
+        self._count = 0
+        self._started = None
+        self._checkpoint = None
+        self._closed = False
+        self._lock = threading.Condition()
+        self._thread = threading.Thread(target=self._flush_on_time)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def send(self, dp):
+        with self._lock:
+            columns = sorted(dp.keys())
+            if columns != self.columns:
+                self._flush()
+                self.columns = columns
+                self.pipe.send(('schema', columns))
+                self._values = [[] for column in columns]
+            for values, column in zip(self._values, columns):
+                values.append(dp[column])
+            self._count += 1
+            if self._count >= self.size:
+                self._flush()
+            elif self._count == 1:
+                self._started = time.monotonic()
+                self._lock.notify()
+
+    def send_block(self, block):
+        '''
+        Send datapoints given as a dict of one numpy array per column, e.g. a block of streamed samples,
+        as a batch of its own, without a dict per point.
+        '''
+        with self._lock:
+            self._flush()
+            columns = sorted(block.keys())
+            if columns != self.columns:
+                self.columns = columns
+                self.pipe.send(('schema', columns))
+                self._values = [[] for column in columns]
+            self.pipe.send(('batch', [pack(block[column]) for column in columns]))
+            self.batches += 1
+
+    def checkpoint(self, state):
+        '''Send state as a checkpoint with the next batch, when the datapoints so far have been sent.'''
+        with self._lock:
+            self._checkpoint = state
+
+    def send_message(self, message):
+        '''Send a message that is not a datapoint, after the datapoints so far.'''
+        with self._lock:
+            self._flush()
+            self.pipe.send(message)
+
+    def flush(self):
+        with self._lock:
+            self._flush()
+
+    def _flush(self):
+        if self._count > 0:
+            self.pipe.send(('batch', [pack(values) for values in self._values]))
+            self._values = [[] for column in self.columns]
+            self._count = 0
+            self.batches += 1
+        if self._checkpoint is not None:
+            self.pipe.send(('checkpoint', self._checkpoint))
+            self._checkpoint = None
+
+    def _flush_on_time(self):
+        with self._lock:
+            while not self._closed:
+                if self._count == 0:
+                    self._lock.wait()
+                    continue
+                remaining = self._started + self.interval - time.monotonic()
+                if remaining > 0:
+                    self._lock.wait(remaining)
+                else:
+                    self._flush()
+
+    def close(self):
+        '''Send the last batch and stop the background thread.'''
+        with self._lock:
+            self._flush()
+            self._closed = True
+            self._lock.notify()
+        self._thread.join()
@@ -1,11 +1,10 @@
-import psutil
 import select
-import numpy as np
+import itertools
 import os
+import time
+import logging
 import logging.config
 from collections import OrderedDict
-import matplotlib
-matplotlib.rcParams['figure.max_open_warning'] = 100
 
 def create_stamp():
     from datetime import datetime
@@ -55,7 +54,13 @@ def set_logging_config(console_level="WARNING", log_level="DEBUG"):
 if not os.path.exists(_LOG_DIR):
     os.makedirs(_LOG_DIR)
 
+def setup_matplotlib():
+    '''Matplotlib settings for live plotting. Called when plotting is first used, not on import.'''
+    import matplotlib
+    matplotlib.rcParams['figure.max_open_warning'] = 100
+
 def _get_running_procs():
+    import psutil
     procs = []
     for pid in psutil.pids():
         p = psutil.Process(pid)
@@ -108,6 +113,47 @@ def ask_socket_raw(s, cmd):
         time.sleep(.01)
     return data
 
+# Instrument pipe protocol. Requests are tuples (request_id, opcode, name, args, kwargs, sent)
+# and replies are tuples (request_id, status, value). Request ids are (process id, count), so the
+# ids of processes that use the same pipe do not collide. sent is the time.monotonic() of sending,
+# from which the daemon measures how long the request waited. Values are sent as native
+# python objects, multiprocessing takes care of pickling and message framing.
+# A BATCH request carries a list of (opcode, name, args, kwargs) entries and is
+# answered with the list of their results. A STREAM request starts a thread in the
+# daemon that calls a function repeatedly and writes its results to a RingBuffer.
+# A WATCH request carries a condition on the instrument's parameters that the daemon
+# evaluates between other requests; it is answered once the condition is true or timed out.
+# An ATTACH request carries a new pipe, on which the daemon serves requests as well.
+# When a request invalidated cached parameters in the daemon, the reply is preceded by
+# (None, INVALIDATE, params) so the proxy drops them as well (None in params stands for all).
+GET, SET, CALL, CLOSE, BATCH, STREAM, WATCH, ATTACH = range(8)
+OK, ERROR, INVALIDATE = range(3)
+OPCODE_NAMES = ['get', 'set', 'call', 'close', 'batch', 'stream', 'watch', 'attach']
+_request_ids = itertools.count()
+
+def send_request(pipe, opcode, name=None, *args, **kwargs):
+    '''Send a request to an instrument daemon and return its request id.'''
+    request_id = (os.getpid(), next(_request_ids))
+    pipe.send((request_id, opcode, name, args, kwargs, time.monotonic()))
+    return request_id
+
+def read_reply(pipe, request_id):
+    '''Receive replies until the one for request_id arrives, dropping stale ones.'''
+    while True:
+        reply_id, status, value = pipe.recv()
+        if reply_id == request_id:
+            return reply_value(reply_id, status, value)
+
+def reply_value(request_id, status, value):
+    if status == ERROR:
+        logging.debug('Request %s failed: %s' %(request_id, value))
+        return None
+    return value
+
+def ask_request(pipe, opcode, name=None, *args, **kwargs):
+    request_id = send_request(pipe, opcode, name, *args, **kwargs)
+    return read_reply(pipe, request_id)
+
 def read_pipe(pipe):
     data = pipe.recv()
     try:
@@ -126,6 +172,7 @@ def flush_pipe(pipe):
         pipe.recv()
 
 def get_array(start, stop, step):
+    import numpy as np
     if (stop-start)<0:
         step = -step
     return np.arange(start, stop+step, step)
\ No newline at end of file
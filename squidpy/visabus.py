@@ -0,0 +1,287 @@
+import os
+import time
+import atexit
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+
+# VISA backend for all resource managers, e.g. '@sim' for pyvisa-sim.
+_backend = os.environ.get('SQUIDPY_VISA_BACKEND', '')
+_resource_managers = {}
+_buses = {}
+_lock = threading.Lock()
+
+def set_backend(backend):
+    '''
+    Select the VISA backend used for resources opened from now on ('' is the default backend).
+    Set SQUIDPY_VISA_BACKEND to select it in InstrumentDaemon processes as well.
+    '''
+    global _backend
+    _backend = backend
+    os.environ['SQUIDPY_VISA_BACKEND'] = backend
+
+def get_resource_manager(backend=None):
+    '''Return the ResourceManager shared by all drivers in this process.'''
+    import visa
+    backend = _backend if backend is None else backend
+    with _lock:
+        if backend not in _resource_managers:
+            _resource_managers[backend] = visa.ResourceManager(backend) if backend else visa.ResourceManager()
+        return _resource_managers[backend]
+
+def interface_name(address):
+    '''Name of the bus a resource is on. Only GPIB boards are shared, other resources get their own bus.'''
+    board = address.split('::')[0]
+    return board if board.upper().startswith('GPIB') else address
+
+def open_resource(address, backend=None):
+    '''
+    Open a VISA resource whose I/O is scheduled by the VisaBus of its interface.
+    Addresses starting with SIM:: open a simulated instrument, see squidpy.sim.
+    '''
+    backend = _backend if backend is None else backend
+    key = (interface_name(address), backend)
+    with _lock:
+        if key not in _buses:
+            _buses[key] = VisaBus(key[0], backend)
+        bus = _buses[key]
+    bus.open(address)
+    return BusResource(bus, address)
+
+def bus_stats():
+    '''Statistics of all buses in this process.'''
+    return {'%s%s' %key: bus.stats() for key, bus in list(_buses.items())}
+
+@atexit.register
+def stop_buses():
+    '''Stop the threads of all buses and close their handles, so drivers closed afterwards do not wait for them.'''
+    for bus in list(_buses.values()):
+        bus.stop()
+
+class VisaBus(object):
+    '''
+    Owner of one VISA interface in this process.
+    A single thread does all I/O on the interface. Requests are queued per resource and served
+    round-robin, so one chatty driver cannot starve the other instruments on the bus.
+    Resource handles are pooled: opening the same address twice shares one handle.
+    Writes are pipelined: they return as soon as they are queued, and errors are raised on the
+    next synchronous call on the same resource.
+    '''
+    def __init__(self, interface, backend='', pipeline_writes=True):
+        self.interface = interface
+        self.backend = backend
+        self.pipeline_writes = pipeline_writes
+        self._queues = OrderedDict()
+        self._condition = threading.Condition()
+        self._handles = {}
+        self._refcounts = {}
+        self._started = time.monotonic()
+        self._busy_time = 0.
+        self._requests = 0
+        self._resource_stats = {}
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, name='VisaBus %s' %interface)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def open(self, address):
+        with self._condition:
+            self._refcounts[address] = self._refcounts.get(address, 0) + 1
+            if self._refcounts[address] > 1:
+                return
+        try:
+            self.submit(address, '__open__')
+        except Exception:
+            with self._condition:
+                self._refcounts[address] -= 1
+            raise
+
+    @property
+    def alive(self):
+        '''True while the bus thread serves requests.'''
+        return not self._stopped and self._thread.is_alive()
+
+    def release(self, address):
+        '''
+        Drop one reference to a resource and close its handle when it is no longer used.
+        Does not wait for the bus, as drivers release their resources from __del__. Once the
+        bus has stopped, e.g. at interpreter shutdown, the handle is closed right here.
+        '''
+        with self._condition:
+            self._refcounts[address] -= 1
+            if self._refcounts[address] > 0:
+                return
+        if self.alive:
+            self.submit(address, 'close', wait=False)
+        else:
+            self._close_handle(address)
+
+    def stop(self, timeout=1.):
+        '''Stop the bus thread after the request it is serving, and close all handles.'''
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+        if self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+        if not self._thread.is_alive():
+            for address in list(self._handles):
+                self._close_handle(address)
+
+    def _close_handle(self, address):
+        handle = self._handles.pop(address, None)
+        if handle is not None:
+            try:
+                handle.close()
+            except Exception:
+                pass
+
+    def submit(self, address, method, args=(), kwargs={}, wait=True):
+        '''Queue a call of method on the resource. Returns the result, or a Future if wait is False.'''
+        future = Future()
+        with self._condition:
+            if self._stopped or not self._thread.is_alive():
+                raise RuntimeError('VISA bus %s is stopped' %self.interface)
+            if address not in self._queues:
+                self._queues[address] = deque()
+            self._queues[address].append((method, args, kwargs, future))
+            self._condition.notify()
+        if wait:
+            return future.result()
+        return future
+
+    def _next_request(self):
+        with self._condition:
+            while not self._stopped:
+                for address in self._queues:
+                    if len(self._queues[address]) > 0:
+                        self._queues.move_to_end(address)
+                        return address, self._queues[address].popleft()
+                self._condition.wait()
+            # Requests still queued are not served anymore
+            for queue in self._queues.values():
+                while len(queue) > 0:
+                    queue.popleft()[3].cancel()
+            return None
+
+    def _run(self):
+        while True:
+            request = self._next_request()
+            if request is None:
+                return
+            address, (method, args, kwargs, future) = request
+            if not future.set_running_or_notify_cancel():
+                continue
+            t0 = time.monotonic()
+            try:
+                future.set_result(self._execute(address, method, args, kwargs))
+            except Exception as e:
+                future.set_exception(e)
+            duration = time.monotonic() - t0
+            self._busy_time += duration
+            self._requests += 1
+            stats = self._resource_stats.setdefault(address, {'requests': 0, 'busy_time': 0.})
+            stats['requests'] += 1
+            stats['busy_time'] += duration
+
+    def _execute(self, address, method, args, kwargs):
+        if method == '__open__':
+            if address.upper().startswith('SIM::'):
+                from squidpy import sim
+                self._handles[address] = sim.open_resource(address)
+            else:
+                self._handles[address] = get_resource_manager(self.backend).open_resource(address)
+            return None
+        handle = self._handles[address]
+        if method == '__getattr__':
+            return getattr(handle, args[0])
+        elif method == '__setattr__':
+            return setattr(handle, *args)
+        elif method == 'close':
+            del self._handles[address]
+        return getattr(handle, method)(*args, **kwargs)
+
+    def stats(self):
+        '''Fraction of time the bus was busy, request counts and queue lengths.'''
+        elapsed = time.monotonic() - self._started
+        with self._condition:
+            queued = {address: len(queue) for address, queue in self._queues.items()}
+        return {'utilisation': self._busy_time/elapsed if elapsed > 0 else 0.,
+                'requests': self._requests,
+                'busy_time': self._busy_time,
+                'resources': {address: dict(stats, queued=queued.get(address, 0)) for address, stats in list(self._resource_stats.items())}}
+
+class BusResource(object):
+    '''
+    Proxy for a pyvisa resource on a VisaBus, with the same write/query/read methods.
+    Attribute access (timeout, read_termination, ...) is forwarded through the bus as well,
+    so it happens in order with the queued I/O.
+    '''
+    def __init__(self, bus, address):
+        object.__setattr__(self, '_bus', bus)
+        object.__setattr__(self, '_address', address)
+        object.__setattr__(self, '_pending_writes', [])
+
+    def _call(self, method, *args, **kwargs):
+        self._check_writes()
+        return self._bus.submit(self._address, method, args, kwargs)
+
+    def _check_writes(self):
+        '''Raise the first error of a pipelined write that has completed.'''
+        pending = self._pending_writes
+        while len(pending) > 0 and pending[0].done():
+            error = pending.pop(0).exception()
+            if error is not None:
+                del pending[:]
+                raise error
+
+    def flush(self):
+        '''Wait until all pipelined writes are done.'''
+        for future in self._pending_writes:
+            future.result()
+        del self._pending_writes[:]
+
+    def write(self, *args, **kwargs):
+        if not self._bus.pipeline_writes:
+            return self._call('write', *args, **kwargs)
+        self._check_writes()
+        self._pending_writes.append(self._bus.submit(self._address, 'write', args, kwargs, wait=False))
+
+    def query(self, *args, **kwargs):
+        return self._call('query', *args, **kwargs)
+
+    def ask(self, *args, **kwargs):
+        return self._call('query', *args, **kwargs)
+
+    def read(self, *args, **kwargs):
+        return self._call('read', *args, **kwargs)
+
+    def read_raw(self, *args, **kwargs):
+        return self._call('read_raw', *args, **kwargs)
+
+    def write_raw(self, *args, **kwargs):
+        return self._call('write_raw', *args, **kwargs)
+
+    def query_binary_values(self, *args, **kwargs):
+        return self._call('query_binary_values', *args, **kwargs)
+
+    def query_ascii_values(self, *args, **kwargs):
+        return self._call('query_ascii_values', *args, **kwargs)
+
+    def clear(self):
+        return self._call('clear')
+
+    def close(self):
+        try:
+            # Pipelined writes are only waited for while the bus still serves them
+            if self._bus.alive:
+                self.flush()
+        finally:
+            self._bus.release(self._address)
+
+    def __getattr__(self, name):
+        if name.startswith('__'):
+            raise AttributeError(name)
+        return self._call('__getattr__', name)
+
+    def __setattr__(self, name, value):
+        self._call('__setattr__', name, value)